@@ -26,11 +26,21 @@ A:  The **kw for all functions at run time are for the custom lookup feature:
 
 from __future__ import print_function
 import os
-from datetime import datetime
+import re
+from datetime import datetime, timezone
 import operator
 import sys
 import inspect
 import json
+import threading
+import weakref
+import copy
+import marshal
+import hashlib
+import asyncio
+from time import perf_counter
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import partial
 from ast import literal_eval
 
@@ -64,6 +74,127 @@ def xbool(o):
     return bbb(o)
 
 
+class LRUCache:
+    """
+    Bounded, thread safe LRU cache with hit, miss and eviction statistics.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._d = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        # no lock for reads (hot, in the getters), counts may be approximate then:
+        v = self._d.get(key, nil)
+        if v is nil:
+            self.misses += 1
+            return default
+        self.hits += 1
+        try:
+            self._d.move_to_end(key)
+        except KeyError:
+            pass  # evicted meanwhile
+        return v
+
+    def set(self, key, v):
+        with self._lock:
+            self._d[key] = v
+            self._d.move_to_end(key)
+            if len(self._d) > self.maxsize:
+                self._d.popitem(last=False)
+                self.evictions += 1
+
+    __setitem__ = set
+
+    def __len__(self):
+        return len(self._d)
+
+    def clear(self):
+        with self._lock:
+            self._d.clear()
+
+    def stats(self):
+        n = self.hits + self.misses
+        return {
+            'size': len(self._d),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / n if n else 0.0,
+        }
+
+
+class BuildCache(LRUCache):
+    """
+    Cache of built conditions, see parse_cond(cond, cache=True).
+
+    Keyed by the condition and the build config. Invalidate via clear() (or
+    clear_caches()) when you modify OPS or lookup providers in place.
+    """
+
+    @staticmethod
+    def key(cond, lookup, cfg):
+        c = cond if is_str(cond) else repr(cond)
+        return c, lookup, repr(sorted(cfg.items()))
+
+
+class GetterCache(OrderedDict):
+    """
+    Size bounded cache of the deep2 / deep3 getters per key, evicting the oldest
+    entries, i.e. FIFO (in insertion order, reads don't reorder) - no latency spikes
+    from full flushes.
+
+    Module wide by default - pass getter_cache=GetterCache(...) (or True) to parse_cond
+    or qualify to have one per condition or qualifier.
+    Reads are plain (thread safe) dict reads, the getters count hits and misses (a
+    miss: no getter for the key or, deep2, none for the shape of the item).
+    """
+
+    def __init__(self, maxsize=100000):
+        OrderedDict.__init__(self)
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __setitem__(self, key, v):
+        with self._lock:
+            OrderedDict.__setitem__(self, key, v)
+            while len(self) > self.maxsize:
+                self.popitem(last=False)  # O(1), unlike popping dict's first key
+                self.evictions += 1
+
+    def stats(self):
+        n = self.hits + self.misses
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / n if n else 0.0,
+        }
+
+
+build_cache = BuildCache()
+lookup_args_cache = LRUCache(1024)
+
+
+def lookup_args(f):
+    """sig_args of a lookup function, memoized - a build of many conditions has the same"""
+    k = (f.func, len(f.args), tuple(f.keywords)) if _is(f, partial) else f
+    try:
+        r = lookup_args_cache.get(k)
+    except TypeError:  # unhashable
+        return sig_args(f)
+    if r is None:
+        r = sig_args(f)
+        lookup_args_cache.set(k, r)
+    return r
+
+
 # fmt:off
 # from dir(operator):
 _ops = {
@@ -132,6 +263,34 @@ def _in(a, b):
     return a in b
 
 
+def _in_set(s, a, b):
+    """in, against the frozenset s of the compare values b (see spec_val)"""
+    try:
+        return a in s
+    except TypeError:  # unhashable, can't be in there
+        return False
+
+
+def matches(a, b):
+    """a matches the regex b"""
+    try:
+        return re.search(b, a) is not None
+    except TypeError:  # not a string
+        return False
+
+
+def _matches_rx(rx, a, b):
+    """matches, with the regex b precompiled into rx (see spec_val)"""
+    try:
+        return rx.search(a) is not None
+    except TypeError:
+        return False
+
+
+def is_in_op(f_op):
+    return f_op is _in or getattr(f_op, 'func', None) is _in_set
+
+
 def get_ops():
     return _ops
 
@@ -140,11 +299,13 @@ def add_built_in_ops():
     OPS['truthy'] = truthy
     OPS['falsy'] = falsy
     OPS['in'] = _in
+    OPS['matches'] = matches
 
 
 def clear_ops():
     OPS.clear()
     OPS_SYMBOLIC.clear()
+    build_cache.clear()
 
 
 def parse_ops():
@@ -164,6 +325,7 @@ def parse_ops():
 def ops_use_symbolic(allow_single_eq=False):
     OPS.clear()
     OPS.update(OPS_SYMBOLIC)
+    build_cache.clear()
     add_built_in_ops()
     if allow_single_eq:
         OPS['='] = OPS['==']
@@ -193,6 +355,12 @@ OPS_HK_APPLIED = False
 State = {}
 
 
+# get_deep2: kinds of path steps and max. nr of remembered shapes per key:
+SHAPE_GET, SHAPE_IDX, SHAPE_ATTR = 1, 2, 3
+MAX_SHAPES = 8
+SHAPE_MISS = object()
+
+
 class Getters:
     def state_get_deep(key, val, cfg, state=State, deep='.', **kw):
         """
@@ -254,43 +422,81 @@ class Getters:
                 return None, None
         return state, g
 
-    _get_deep2_cache = {}
+    def _dig_shape(state, key, sep):
+        """Like _diginto, but delivering the shape of the state along the path:
+        (type, kind, part) per step"""
+        shape = ()
+        parts = key.split(sep) if _is(key, str) else key
+        for part in parts:
+            if not state:
+                return None, None
+            typ = state.__class__
+            try:
+                state = state.get(part)
+                shape += ((typ, SHAPE_GET, part),)
+            except AttributeError as ex:
+                try:
+                    i = int(part)
+                    state = state[i]
+                    shape += ((typ, SHAPE_IDX, i),)
+                except ValueError as ex:  # i no list index, we try attrs:
+                    state = getattr(state, part, None)
+                    shape += ((typ, SHAPE_ATTR, part),)
+                except IndexError as ex:
+                    return None, None
+        if not state:
+            return None, None
+        return state, shape
+
+    _get_deep2_cache = GetterCache()
 
     def get_deep2(key, val, cfg, state, deep='.', _c=_get_deep2_cache, **kw):
         """
-        Here we cache the split result
+        Polymorphic inline cache: Per key we keep getters for up to MAX_SHAPES shapes
+        (state types along the path), learned from the first matching items.
+        The matching one is picked by type checks, i.e. streams with differently
+        structured items are served w/o exceptions.
         """
-        funcs = _c.get(key)
-        if funcs:
-            try:
-                if funcs[0] == True:
-                    for f in funcs[1:]:
-                        state = state[f]
-                else:
-                    for f in funcs:
-                        state = f(state)  # we have itemgetters and attrsgettr
-                return state, val
-            except Exception:
-                return None, val
-
-        state, g = Getters._diginto(state, key, sep=deep)
+        shapes = _c.get(key)
+        if shapes:
+            for f in shapes:
+                s = f(state)
+                if s is not SHAPE_MISS:
+                    _c.hits += 1
+                    return s, val
+        _c.misses += 1
+
+        state, shape = Getters._dig_shape(state, key, sep=deep)
         if state is None:
             return state, val
 
-        # we have matching structure => invest in assembling the getter functions
-        # If there are no getattr (=>no tuple), then just []-ing the values is even faster then using itemgetter:
-        # so we mark those with a True in the beginning and just remember the values:
-        if len(_c) > 1000000:
-            _c.clear()   # safety belt
-        if not any([i for i in g if _is(i, tuple)]):
-            _c[key] = g = list(g)
-            g.insert(0, True)
-        else:
-            a, i = operator.attrgetter, operator.itemgetter
-            _c[key] = [a(f[0]) if isinstance(f, tuple) else i(f) for f in g]
+        # we have matching structure => remember it:
+        if shapes is None:
+            _c[key] = shapes = []
+        elif len(shapes) == MAX_SHAPES:
+            shapes.pop(0)
+        shapes.append(Getters._shape_getter(shape))
         return state, val
 
-    _get_deep3_cache = {}
+    def _shape_getter(shape):
+        """Builds the getter for one shape, returning SHAPE_MISS for other shapes"""
+        ns = {'SHAPE_MISS': SHAPE_MISS}
+        src = ['def get_shape(s):', '    try:']
+        for nr, (typ, kind, part) in zip(range(len(shape)), shape):
+            ns['t%s' % nr], ns['p%s' % nr] = typ, part
+            src += ['        if not s:', '            return None']
+            src += ['        if s.__class__ is not t%s:' % nr, '            return SHAPE_MISS']
+            if kind == SHAPE_GET:
+                src.append('        s = s.get(p%s)' % nr)
+            elif kind == SHAPE_IDX:
+                src.append('        s = s[p%s]' % nr)
+            else:
+                src.append('        s = getattr(s, p%s, None)' % nr)
+        src += ['        return s', '    except IndexError:', '        return None']
+        exec('\n'.join(src), ns)
+        return ns['get_shape']
+
+    _get_deep3_cache = GetterCache()
 
     def get_deep_evl(key, val, cfg, state, deep='.', _c=_get_deep3_cache, **kw):
         """
@@ -298,10 +504,12 @@ class Getters:
         """
         funcs = _c.get(key)
         if funcs:
+            _c.hits += 1
             try:
                 return funcs(state), val
             except Exception:
                 return None, val
+        _c.misses += 1
         state, g = Getters._diginto(state, key, sep=deep)
         if state is None:
             return state, val
@@ -314,8 +522,6 @@ class Getters:
         g = f'lambda s: s{g}'
         if '(' in g and ')' in g:
             g = 'lambda s: None'
-        if len(_c) > 1000000:
-            _c.clear()   # safety belt
         _c[key] = eval(g)
         return state, val
 
@@ -323,6 +529,49 @@ class Getters:
 def clear_caches():
     Getters._get_deep2_cache.clear()
     Getters._get_deep3_cache.clear()
+    build_cache.clear()
+
+
+def build_deep_getter(key, val, sep):
+    """
+    Resolves a deep key at build time into a lookup function for one atom:
+    s.get(part) for dicts, s[int] for lists - like state_get_deep, but w/o splitting and
+    probing per evaluation.
+    Other shapes are resolved in the step as well, not again from the root: attributes
+    (objects w/o get) and tuples guarded inline, the rest via deep_step.
+    """
+    parts = key.split(sep) if is_str(key) else key
+    src = ['def deep_get(state=State, **kw):', '    s = state']
+    for p in parts:
+        try:
+            i = int(p)
+        except ValueError:
+            src += ['    if s.__class__ is dict:', '        s = s.get(%r)' % (p,), '    else:']
+            src += ['        g = getattr(s, "get", None)']
+            src += ['        s = getattr(s, %r, None) if g is None else g(%r)' % (p, p)]
+        else:
+            have = 'len(s) > %d' % i if i >= 0 else 'len(s) >= %d' % -i
+            src += ['    c = s.__class__', '    if c is list or c is tuple:']
+            src += ['        s = s[%d] if %s else None' % (i, have), '    elif c is dict:']
+            src += ['        s = s.get(%r)' % (p,), '    else:', '        s = deep_step(s, %r)' % (p,)]
+        src += ['    if not s:', '        return s, val']
+    src += ['    return s, val']
+    ns = {'State': State, 'val': val, 'deep_step': deep_step}
+    exec('\n'.join(src), ns)
+    return ns['deep_get']
+
+
+def deep_step(s, part):
+    """One step of state_get_deep, for the shapes other than dict and list"""
+    try:
+        return s.get(part)
+    except AttributeError:
+        try:
+            return s[int(part)]
+        except ValueError:
+            return getattr(s, part, None)
+        except IndexError:
+            return None
 
 
 state_get_deep = Getters.state_get_deep
@@ -387,6 +636,7 @@ def comb(op, lazy_on, negate=None):
     #             ex.args[0][0] = fgr
     #             raise ex
 
+    _comb.op = op  # for the compile backend
     return _comb
 
 
@@ -433,8 +683,25 @@ def prepare(cond, cfg, nfo):
     # resolve any conditions builds using the same subcond refs many times -
     # i.e. remove those refs can create unique items we can modify during parsing:
     # NOTE: This is build time, not eval time, i.e. does not hurt much:
-    cond = literal_eval(str(cond))
-    res = parse_struct_cond(cond, cfg, nfo)
+    try:
+        cond = marshal.loads(marshal.dumps(cond))
+    except ValueError:  # e.g. str subclasses
+        cond = literal_eval(str(cond))
+    check_modes(cfg)
+    nfo['tree'] = tree = struct_tree(cond, cfg, nfo)
+    if cfg.get('instrument') is True:
+        cfg['instrument'] = Stats()
+    if cfg.get('instrument') not in (None, False):
+        nfo['stats'] = cfg['instrument']
+    if cfg.get('aio'):
+        res = aio_tree(tree, cfg)
+    elif cfg.get('compile'):
+        # prefix is handled within the compiled function:
+        return compile_tree(tree, cfg, nfo)
+    else:
+        res = tree_func(tree, cfg)
+        if cfg.get('prefetch'):
+            res = prefetch_func(res, tree, cfg)
     p = cfg.get('prefix', None)
     if not p:
         return res
@@ -474,24 +741,28 @@ def parse_struct_cond(cond, cfg, nfo):
     [a eq foo] and b
     [a eq foo] and [b is baz]
     """
-    f1 = None
+    return tree_func(struct_tree(cond, cfg, nfo), cfg)
+
+
+def struct_tree(cond, cfg, nfo):
+    """Walks a struct condition into a tree of nodes, which the backends build from:
+
+    {'typ': 'atom', 'func': <atomic cond>, ...} (see atomic_spec)
+    {'typ': 'bool', 'val': True}
+    {'typ': 'comb', 'op': 'and', 'left': <node>, 'right': <node>}
+    """
+    n1 = None
     while cond:
         key = cond.pop(0)
         kt = key_type(key)
         if kt:
             if kt == KEY_STR_TYP:
-                if f1 and key in COMB_OPS:
+                if n1 and key in COMB_OPS:
                     # cond: b eq bar
-                    return partial(
-                        COMB_OPS[key],
-                        f1,
-                        parse_struct_cond(cond, cfg, nfo),
-                    )
+                    r = struct_tree(cond, cfg, nfo)
+                    return {'typ': 'comb', 'op': key, 'left': n1, 'right': r}
             elif kt == KEY_BOOL_TYP:
-
-                def f1(*a, _=key, **kw):
-                    return bool(_)
-
+                n1 = {'typ': 'bool', 'val': key}
                 continue
             elif kt == KEY_LST_TYP:
                 key = tuple(key)
@@ -501,22 +772,535 @@ def parse_struct_cond(cond, cfg, nfo):
                 if _is(cond[0], str) and cond[0] in COMB_OPS:
                     break
                 ac.append(cond.pop(0))
-            f1 = atomic_cond(ac, cfg, nfo)
+            n1 = atomic_spec(ac, cfg, nfo)
             # now a combinator MUST come:
         else:
             # key is not a key but the first cond:
-            f1 = parse_struct_cond(key, cfg, nfo)
+            n1 = struct_tree(key, cfg, nfo)
+    return n1
+
+
+# the wrappers of the default backend, one at a time (see tree_func):
+TREE_MODES = ('cse', 'instrument', 'incremental', 'adaptive')
+# options for the partial chain backend, w/o any the batch APIs compile:
+CHAIN_OPTS = ('asyn', 'aio', 'prefetch') + TREE_MODES
+
+
+def check_modes(cfg):
+    """Raises for modes which can't work together, instead of ignoring some"""
+    modes = [k for k in TREE_MODES if cfg.get(k) not in (None, False)]
+    if len(modes) > 1:
+        raise ValueError('Can not combine %s' % ' and '.join(modes))
+    backend = [k for k in ('aio', 'compile') if cfg.get(k)]
+    if modes and backend:
+        raise ValueError('%s is not supported with %s' % (modes[0], backend[0]))
+
+
+def tree_func(node, cfg):
+    """The default backend: nested partials"""
+    if not node:
+        return None
+    reg = cfg.get('cse')
+    if _is(reg, dict):
+        return cse_func(node, cfg, reg)[1]
+    st = cfg.get('instrument')
+    if st not in (None, False):
+        return instr_func(node, cfg, st)
+    reg = cfg.get('incremental')
+    if _is(reg, dict):
+        return dirty_func(node, cfg, reg)[0]
+    typ = node['typ']
+    if typ == 'atom':
+        return node['func']
+    if typ == 'bool':
+        return bool_func(node['val'])
+    if cfg.get('adaptive') and getattr(COMB_OPS[node['op']], 'op', None) in (AND, OR):
+        return adaptive_func(node, cfg)
+    l, r = tree_func(node['left'], cfg), tree_func(node['right'], cfg)
+    return partial(COMB_OPS[node['op']], l, r)
+
+
+def node_src(node):
+    """Source text of a tree node, e.g. 'a eq 1 and [b or c]'"""
+    if node['typ'] == 'atom':
+        return ' '.join([str(s) for s in node['src']])
+    if node['typ'] == 'bool':
+        return str(node['val'])
+    l, r = node['left'], node['right']
+    l, r = [('[%s]' if n['typ'] == 'comb' else '%s') % node_src(n) for n in (l, r)]
+    return '%s %s %s' % (l, node['op'], r)
+
+
+def instr_func(node, cfg, stats):
+    """
+    parse_cond(cond, instrument=True): The atoms and combinators are built into
+    functions recording their evaluations into a Stats object (nfo['stats']).
+
+    Only on request, i.e. uninstrumented builds are the same than before.
+    """
+    typ = node['typ']
+    if typ == 'bool':
+        return bool_func(node['val'])
+    e = stats.node(node_src(node))
+    if typ == 'atom':
+        n = node
+        return partial(f_atomic_instr, e, n['f_op'], n['lookup'], n['not'], n['rev'], n['acl'])
+    l, r = instr_func(node['left'], cfg, stats), instr_func(node['right'], cfg, stats)
+    f_comb = COMB_OPS[node['op']]
+    # result of the left side, at which the right one is short circuited:
+    lazy = {OR: True, OR_NOT: True, AND: False, AND_NOT: False}.get(f_comb.op)
+    if lazy is not None:
+        # all nodes of the right side are skipped then:
+        skipped = [stats.node(node_src(n)) for n in tree_nodes(node['right'])]
+        l = partial(f_left_instr, lazy, skipped, l)
+    return partial(f_comb_instr, e, partial(f_comb, l, r))
+
+
+def f_atomic_instr(e, f_op, fp_lookup, not_, rev_, acl, **kw):
+    t0 = perf_counter()
+    k, v = fp_lookup(**kw)
+    t1 = perf_counter()
+    if acl is True:
+        k = py_type(k)
+    if rev_ is True:
+        k, v = v, k
+    r = not f_op(k, v) if not_ is True else f_op(k, v)
+    t2 = perf_counter()
+    e.add(r, t2 - t0, t1 - t0)
+    return r
+
+
+def f_comb_instr(e, f, **kw):
+    t0 = perf_counter()
+    r = f(**kw)
+    e.add(r, perf_counter() - t0)
+    return r
+
+
+def f_left_instr(lazy, skipped, f, **kw):
+    r = f(**kw)
+    if bool(r) is lazy:
+        for e in skipped:
+            e.skips += 1
+    return r
+
+
+class NodeStats:
+    """
+    Evaluation stats of a condition node.
+
+    times are sums in seconds, hist is a latency histogram with log2 buckets:
+    hist[i] counts evaluations taking less than 2**i microseconds (i>0).
+    """
+
+    __slots__ = ('evals', 'trues', 'skips', 'time', 't_lookup', 'hist')
+    buckets = 24
+
+    def __init__(self):
+        self.evals = self.trues = self.skips = 0
+        self.time = self.t_lookup = 0.0
+        self.hist = [0] * self.buckets
+
+    def add(self, res, dt, t_lookup=0.0):
+        self.evals += 1
+        if res:
+            self.trues += 1
+        self.time += dt
+        self.t_lookup += t_lookup
+        self.hist[min(int(dt * 1e6).bit_length(), self.buckets - 1)] += 1
+
+    def as_dict(self):
+        d = dict([(k, getattr(self, k)) for k in self.__slots__])
+        d['t_op'] = self.time - self.t_lookup
+        d['falses'] = self.evals - self.trues
+        return d
+
+
+class Stats(dict):
+    """Node stats of instrumented conditions, keyed by the source text of the nodes"""
+
+    def node(self, src):
+        e = self.get(src)
+        if e is None:
+            e = self[src] = NodeStats()
+        return e
+
+    def report(self):
+        return dict([(k, v.as_dict()) for k, v in self.items()])
+
+
+def aio_tree(tree, cfg):
+    """
+    parse_cond(cond, aio=True): The condition is built into an awaitable evaluator:
+
+        await f(state=...)
+
+    Lookup providers may be coroutine functions. Within and / or chains the branches
+    with providers are awaited concurrently, remaining ones are cancelled when the
+    result is known. Branches w/o providers are evaluated (sync) first, in order.
+    And / or chain results are normalized to bools.
+    """
+    is_async, f = aio_func(tree, cfg)
+    return partial(aio_run, is_async, f)
+
+
+async def aio_run(is_async, f, **kw):
+    if CACHE_KEY not in kw:
+        kw[CACHE_KEY] = {}
+    return await f(**kw) if is_async else f(**kw)
+
+
+def aio_func(node, cfg):
+    """Returns (is_async, func), subtrees w/o lookup providers are built sync"""
+    if not node or not any([a['provider'] for a in tree_atoms(node)]):
+        return False, tree_func(node, cfg) or bool_func(None)
+    if node['typ'] == 'atom':
+        n = node
+        return True, partial(aio_atom, n['f_op'], n['lookup'], n['not'], n['rev'], n['acl'])
+    op = node['op']
+    if getattr(COMB_OPS[op], 'op', None) not in (AND, OR):
+        l, r = aio_func(node['left'], cfg), aio_func(node['right'], cfg)
+        return True, partial(aio_comb, COMB_OPS[op].op, l, r)
+    branches = []
+    while node['typ'] == 'comb' and node['op'] == op:
+        branches.append(aio_func(node['left'], cfg))
+        node = node['right']
+    branches.append(aio_func(node, cfg))
+    return True, partial(aio_chain, op == 'or', branches)
+
+
+async def aio_atom(f_op, fp_lookup, not_, rev_, acl, **kw):
+    kv = fp_lookup(**kw)
+    if inspect.isawaitable(kv):
+        kv = await kv
+    k, v = kv
+    if acl is True:
+        k = py_type(k)
+    if rev_ is True:
+        k, v = v, k
+    return not f_op(k, v) if not_ is True else f_op(k, v)
+
+
+async def aio_call(b, kw):
+    return await b[1](**kw) if b[0] else b[1](**kw)
+
+
+async def aio_comb(op, l, r, **kw):
+    fr = await aio_call(l, kw)
+    if op == AND_NOT:
+        return fr and not await aio_call(r, kw)
+    elif op == OR_NOT:
+        return fr or not await aio_call(r, kw)
+    return fr is not await aio_call(r, kw)
+
+
+async def aio_chain(stop_on, branches, **kw):
+    tasks = []
+    try:
+        for is_async, f in branches:
+            if is_async:
+                tasks.append(asyncio.ensure_future(f(**kw)))
+            elif bool(f(**kw)) is stop_on:
+                return stop_on
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if bool(t.result()) is stop_on:
+                    return stop_on
+        return not stop_on
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+async def aio_res(res, cache, key):
+    """Awaiting results of async lookup providers, into the item's cache"""
+    if inspect.isawaitable(res):
+        res = await res
+    if inspect.isawaitable(res[0]):
+        res = (await res[0], res[1])
+    cache[key] = res[0]
+    return res
+
+
+async def aio_cached(fut, val=nil):
+    """
+    Awaiting the future of an async lookup, which is in the item's cache while in
+    flight, i.e. shared by concurrent lookups (the first one gets the provider's
+    compare value).
+    """
+    res = await asyncio.shield(fut)  # cancelling one of them must not cancel it
+    return res if val is nil else (res[0], val)
+
+
+prefetch_pool = [None]  # default executor, created on first use
+
+
+def prefetch_func(f, tree, cfg):
+    """
+    parse_cond(cond, prefetch=True): At evaluation start the lookup providers of the
+    condition are submitted to a thread pool (cfg 'prefetch_pool' or a shared default
+    one), their futures put into the item's pyc_cache, where the lookups find them.
+
+    prefetch=<int> limits the number of prefetched providers per item,
+    prefetch=<list of provider names> selects them.
+    Futures not consumed by the evaluation (short circuit) are cancelled and removed
+    from the cache. Sub conditions of qualify and asyn providers are not prefetched.
+    """
+    pf, lps = cfg['prefetch'], {}
+    for a in tree_atoms(tree):
+        k = a['key']
+        if not a['provider'] or not _is(k, str):
+            continue
+        k = k[1:] if k[0] == ':' else k
+        if k in cfg.get('asyn', ()) or getattr(find_func(k, cfg), 'pyc_sub_cond', False):
+            continue
+        if _is(pf, (list, tuple, set)) and k not in pf and ':' + k not in pf:
+            continue
+        lps.setdefault(k, a['lookup'])
+    lps = list(lps.items())
+    if _is(pf, int) and pf is not True:
+        lps = lps[:pf]
+    if not lps:
+        return f
+    return partial(f_prefetch, f, lps, cfg.get('prefetch_pool'))
+
+
+def f_prefetch(f, lps, pool, **kw):
+    c = kw.get(CACHE_KEY)
+    if c is None:
+        c = kw[CACHE_KEY] = {}
+    if pool is None:
+        pool = prefetch_pool[0]
+        if pool is None:
+            pool = prefetch_pool[0] = ThreadPoolExecutor(thread_name_prefix='pycond')
+    futs = []
+    for k, lp in lps:
+        if k not in c:
+            # the worker has its own cache, we must not see its results before done:
+            kwp = dict(kw)
+            kwp[CACHE_KEY] = {}
+            c[k] = fut = pool.submit(partial(lp, **kwp))
+            futs.append((k, fut))
+    try:
+        return f(**kw)
+    finally:
+        for k, fut in futs:
+            if c.get(k) is fut:
+                fut.cancel()
+                del c[k]
+
+
+def dirty_func(node, cfg, reg):
+    """
+    qualify(conds, incremental=True): Nodes are memoized in kw['pyc_memo'], if given
+    (see IncrementalState), registered under the state keys they depend on.
+
+    Returns (func, root keys) - keys are None for nodes with lookup providers, those
+    are not memoized.
+    """
+    typ = node['typ']
+    if typ == 'bool':
+        return bool_func(node['val']), set()
+    if typ == 'atom':
+        f = node['func']
+        keys = None if node['provider'] else set([root_key(node['key'], cfg)])
+    else:
+        l, lk = dirty_func(node['left'], cfg, reg)
+        r, rk = dirty_func(node['right'], cfg, reg)
+        f = partial(COMB_OPS[node['op']], l, r)
+        keys = None if lk is None or rk is None else lk | rk
+    if keys is None:
+        return f, None
+    nid = reg['n'] = reg['n'] + 1
+    for k in keys:
+        reg['by_key'].setdefault(k, []).append(nid)
+    return partial(f_dirty_memo, nid, f), keys
+
+
+def f_dirty_memo(nid, f, **kw):
+    memo = kw.get('pyc_memo')
+    if memo is None:
+        return f(**kw)
+    r = memo.get(nid, nil)
+    if r is nil:
+        r = memo[nid] = f(**kw)
+    return r
+
+
+def root_key(key, cfg):
+    """The top level state key of a condition key"""
+    if _is(key, (tuple, list)):
+        return key[0] if key else key
+    sep = cfg.get('deep') or cfg.get('deep2') or cfg.get('deep3')
+    if sep and _is(key, str):
+        return key.split(sep, 1)[0]
+    return key
+
+
+def tree_nodes(node):
+    """The atoms and combinations of a tree"""
+    if node['typ'] == 'bool':
+        return
+    yield node
+    if node['typ'] == 'comb':
+        for n in tree_nodes(node['left']):
+            yield n
+        for n in tree_nodes(node['right']):
+            yield n
+
+
+def tree_atoms(node):
+    """All atoms of a tree"""
+    if not node or node['typ'] == 'bool':
+        return
+    if node['typ'] == 'atom':
+        yield node
+        return
+    for n in tree_atoms(node['left']):
+        yield n
+    for n in tree_atoms(node['right']):
+        yield n
+
+
+def adaptive_func(node, cfg):
+    """
+    parse_cond(cond, adaptive=True): The operands of an and / or chain are reordered
+    at runtime, by their observed costs and truth rates (see AdaptiveChain).
+
+    Branches containing lookup providers listed in cfg['adaptive_pin'] (e.g. side
+    effecting ones) keep their position, other branches are not moved across them.
+    """
+    op, branches = node['op'], []
+    while node['typ'] == 'comb' and node['op'] == op:
+        branches.append(node['left'])
+        node = node['right']
+    branches.append(node)
+    pin = set(cfg.get('adaptive_pin', ()))
+    pinned = [
+        any([_is(a['key'], str) and a['key'].lstrip(':') in pin for a in tree_atoms(b)])
+        for b in branches
+    ]
+    funcs = [tree_func(b, cfg) for b in branches]
+    w = cfg['adaptive']
+    w = 1000 if w is True else w
+    return partial(f_adaptive, AdaptiveChain(op == 'or', funcs, pinned, window=w))
+
+
+class AdaptiveChain:
+    """
+    Operands of an and / or chain, with their stats over a sliding window.
+
+    Every window evaluations the (unpinned) operands are sorted by cost per decision,
+    i.e. cost / rate of being decisive (false for and, true for or), then the stats are
+    halved. Costs are measured only every sample-th evaluation.
+    """
+
+    def __init__(self, stop_on, funcs, pinned, window=1000, sample=16):
+        self.stop_on = stop_on
+        self.window, self.sample = window, sample
+        self.calls = 0
+        # per branch: func, evals, decisive, cost, timed evals, pinned:
+        self.order = [[f, 0, 0, 0.0, 0, p] for f, p in zip(funcs, pinned)]
+
+    def reorder(self):
+        self.calls = 0
+        timed = [b[3] / b[4] for b in self.order if b[4]]
+        dflt = sum(timed) / len(timed) if timed else 1.0
+
+        def score(b):
+            cost = b[3] / b[4] if b[4] else dflt
+            return cost / ((b[2] + 1.0) / (b[1] + 2.0))
+
+        order, seg = [], []
+        for b in self.order + [None]:
+            if b is None or b[5]:
+                order += sorted(seg, key=score) + ([b] if b else [])
+                seg = []
+            else:
+                seg.append(b)
+        for b in order:
+            b[1], b[2], b[3], b[4] = b[1] // 2, b[2] // 2, b[3] / 2, b[4] // 2
+        self.order = order
+
+
+def f_adaptive(ch, **kw):
+    ch.calls += 1
+    if ch.calls >= ch.window:
+        ch.reorder()
+    stop_on = ch.stop_on
+    if ch.calls % ch.sample:
+        for b in ch.order:
+            b[1] += 1
+            if bool(b[0](**kw)) is stop_on:
+                b[2] += 1
+                return stop_on
+        return not stop_on
+    for b in ch.order:
+        t0 = perf_counter()
+        r = b[0](**kw)
+        b[3] += perf_counter() - t0
+        b[1] += 1
+        b[4] += 1
+        if bool(r) is stop_on:
+            b[2] += 1
+            return stop_on
+    return not stop_on
+
+
+def bool_func(v):
+    def f1(*a, _=v, **kw):
+        return bool(_)
+
     return f1
 
 
+def cse_func(node, cfg, reg):
+    """
+    Common subexpression elimination (qualify(conds, cse=True)):
+
+    Atoms and subtrees are canonicalized, with reg (shared over all conditions of a
+    qualifier) mapping them to one built function each, which memoizes its result in
+    the per item cache.
+    Returns the canonical id and the function.
+    """
+    typ = node['typ']
+    if typ == 'atom':
+        n = node
+        ck = ('atom', n['key'], n['op'], n['not'], n['rev'], n['acl'], repr(n['val']))
+        f = node['func']
+    elif typ == 'bool':
+        ck, f = ('bool', bool(node['val'])), bool_func(node['val'])
+    else:
+        lid, l = cse_func(node['left'], cfg, reg)
+        rid, r = cse_func(node['right'], cfg, reg)
+        ck, f = (node['op'], lid, rid), None
+    have = reg.get(ck)
+    if have:
+        return have
+    if f is None:
+        f = partial(COMB_OPS[node['op']], l, r)
+    cid = len(reg)
+    reg[ck] = have = (cid, partial(f_memo, (CACHE_KEY_CSE, cid), f))
+    return have
+
+
 # _parse_cond = x_parse_cond
 
 OP_PREFIXES = {'not', 'not_rev', 'rev_not', 'rev'}
 
 
 def atomic_cond(cond, cfg, nfo):
+    return atomic_spec(cond, cfg, nfo)['func']
+
+
+def atomic_spec(cond, cfg, nfo):
+    """
+    Builds an atomic condition and returns it, together with its parts, as tree node.
+    """
     # ------------------------------------------------ Handle atomic conditions
     # cond like ['foo', 'not', 'le', '10']
+    src = cond[:]
     key = cond.pop(0)
     # autocondition for key only: not rev contains (None, 0, ...):
     if len(cond) == 0:
@@ -546,20 +1330,23 @@ def atomic_cond(cond, cfg, nfo):
     if not f_op:
         raise Exception('Operator %s not known' % op)
 
-    f_ot = cfg.get('ops_thru')
-    if f_ot:
-        f_op = partial(f_ot, f_op)
-
     val = cond.pop(0)
     # foo eq "42" -> tokenized to 'foo', 'eq', 'str:42' -> should now not
     # become number 42:
     if str(val).startswith('str:'):
         val = str(val[4:])
     else:
-        if cfg.get('autoconv', True):  # can do this in the build phase already:
+        # can do this in the build phase already (not for regexes):
+        if cfg.get('autoconv', True) and f_op is not matches:
             val = py_type(val)  # '42' -> 42
+    f_op, val = spec_val(f_op, val, rev_, cfg)
+
+    f_ot = cfg.get('ops_thru')
+    if f_ot:
+        f_op = partial(f_ot, f_op)
 
     fp_lookup = f_from_lookup_provider(key, val, cfg, nfo)
+    provider = bool(fp_lookup)
 
     if not fp_lookup:
         f_lookup = cfg['lookup']
@@ -567,16 +1354,115 @@ def atomic_cond(cond, cfg, nfo):
             fp_lookup = partial(f_lookup, key, val, cfg=cfg)
         else:
             fp_lookup = partial(f_lookup, key, val)
+        sep = cfg.get('deep') or cfg.get('deep2') or cfg.get('deep3')
+        if sep:
+            fp_lookup = build_deep_getter(key, val, sep)
 
     # we do what we can in the building not the evaluation phase:
     acl = cfg.get('autoconv_lookups', False)
+    mre = cfg.get('multi_regex')
     # try save stackframes and evaluations for the eval phase:
-    if any((acl, rev_, not_)):
+    if _is(mre, dict) and getattr(f_op, 'func', None) is _matches_rx and not (acl or rev_ or provider):
+        # scans shared by the atoms on the same key:
+        f_res = multi_regex_atom(mre, key, f_op.args[0], fp_lookup, not_)
+    elif any((acl, rev_, not_)):
         f_res = partial(f_atomic_arn, f_op, fp_lookup, key, val, not_, rev_, acl)
     else:
         # normal case:
         f_res = partial(f_atomic, f_op, fp_lookup, key, val)
-    return f_res
+    return {
+        'typ': 'atom',
+        'src': src,
+        'key': key,
+        'op': op,
+        'f_op': f_op,
+        'val': val,
+        'not': not_,
+        'rev': rev_,
+        'acl': acl,
+        'lookup': fp_lookup,
+        'provider': provider,
+        'func': f_res,
+    }
+
+
+ISO_TIME = re.compile(
+    r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}:\d{2})?$'
+)
+
+
+def spec_val(f_op, val, rev_, cfg):
+    """
+    Specializing the operator for the compare value, at build time:
+
+    - in [list]: against a frozenset, i.e. O(1) lookups (if the values are hashable)
+    - matches: against the precompiled regex (invalid ones raise here)
+
+    Lookups still get the compare value as given - except with cfg iso_time=True:
+    ISO timestamps are converted to epoch seconds (naive ones as UTC).
+
+    Returns f_op, val
+    """
+    if rev_:
+        return f_op, val
+    if f_op is _in and _is(val, (list, tuple, set)):
+        try:
+            return partial(_in_set, frozenset(val)), val
+        except TypeError:
+            return f_op, val
+    if f_op is matches:
+        rx = val if _is(val, re.Pattern) else re.compile(str(val))
+        return partial(_matches_rx, rx), val
+    if cfg.get('iso_time') and _is(val, str) and ISO_TIME.match(val):
+        t = datetime.fromisoformat(val.replace('Z', '+00:00').replace(' ', 'T'))
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=timezone.utc)
+        return f_op, t.timestamp()
+    return f_op, val
+
+
+def multi_regex_atom(reg, key, rx, fp_lookup, not_):
+    """
+    qualify: The matches atoms on the same key share their scans, i.e. per item
+    every distinct pattern is searched once. Patterns w/o special chars are plain
+    substring tests.
+    """
+    p = rx.pattern
+    if not _is(p, str):
+        f_op = partial(_matches_rx, rx)
+        return partial(f_atomic_arn, f_op, fp_lookup, key, rx, not_, False, False)
+    pats = reg.setdefault(key, {})
+    i = pats.setdefault((p, rx.flags), len(pats))
+    lit = p if rx.flags == re.UNICODE and p and re.escape(p) == p else None
+    return partial(f_multi_regex, ('pyc_re', key), i, rx, lit, fp_lookup, not_)
+
+
+def f_multi_regex(ck, i, rx, lit, fp_lookup, not_, **kw):
+    v = fp_lookup(**kw)[0]
+    cache = kw.get(CACHE_KEY)
+    # the scan results for the value, per item (identity checked):
+    m = cache.get(ck) if cache is not None else None
+    if m is None or m[0] is not v:
+        m = (v, {})
+        if cache is not None:
+            cache[ck] = m
+    r = m[1].get(i)
+    if r is None:
+        if not _is(v, str):
+            r = False
+        else:
+            r = m[1][i] = lit in v if lit is not None else rx.search(v) is not None
+    return not r if not_ else r
+
+
+def f_memo(mk, f, **kw):
+    c = kw.get(CACHE_KEY)
+    if c is None:
+        return f(**kw)
+    r = c.get(mk, nil)
+    if r is nil:
+        r = c[mk] = f(**kw)
+    return r
 
 
 # ------------------------------------------------------------ Evaluation Phase
@@ -631,8 +1517,7 @@ def f_from_lookup_provider(key, val, cfg, nfo):
         func = partial(func, **func_params)
 
     # Multiple sigs are accepted:
-    sig = inspect.getfullargspec(func)
-    req_params = len(sig.args) - (len(sig.defaults) if sig.defaults else 0)
+    sig, req_params = provider_sig(func)
     if req_params == 0 and not sig.varargs:
         # fixed ones, like dt:minutes
         # FIXME: make faster and allow a small sig function for those
@@ -662,6 +1547,8 @@ def f_from_lookup_provider(key, val, cfg, nfo):
         state=State,
         asyn_=key in cfg.get('asyn', []),
         func_=func,
+        aio_=cfg.get('aio'),
+        pf_=bool(cfg.get('prefetch')),
         **kw,
     ):
         if asyn_ and not cache_get(kw, CACHE_KEY_ASYNC):
@@ -672,8 +1559,18 @@ def f_from_lookup_provider(key, val, cfg, nfo):
             raise Async([kw])
         kv = cache_get(kw, key_, val_)
         if kv:
+            if pf_ and _is(kv[0], Future):
+                # prefetched:
+                v = kw[CACHE_KEY][key_] = kv[0].result()[0]
+                return v, val_
+            if aio_ and _is(kv[0], asyncio.Future):
+                return aio_cached(kv[0], val_)  # in flight
             return kv
         res = func_(key_, val_, cfg, state, **kw)
+        if aio_ and (inspect.isawaitable(res) or inspect.isawaitable(res[0])):
+            fut = asyncio.ensure_future(aio_res(res, kw[CACHE_KEY], key_))
+            kw[CACHE_KEY][key_] = fut
+            return aio_cached(fut)
         cache_set(kw, key_, res[0])
         return res
 
@@ -681,6 +1578,25 @@ def f_from_lookup_provider(key, val, cfg, nfo):
 
 
 # ----------------------------------------------- helpers for lookup provider functions
+provider_sigs = weakref.WeakKeyDictionary()  # not keeping e.g. sub_cond closures
+
+
+def provider_sig(func):
+    """getfullargspec is slow, matters when building many conditions"""
+    f, k = (func.func, tuple(sorted(func.keywords))) if _is(func, partial) else (func, ())
+    try:
+        return provider_sigs[f][k]
+    except (KeyError, TypeError):  # TypeError: not weakref-able
+        pass
+    sig = inspect.getfullargspec(func)
+    r = sig, len(sig.args) - (len(sig.defaults) if sig.defaults else 0)
+    try:
+        provider_sigs.setdefault(f, {})[k] = r
+    except TypeError:
+        pass
+    return r
+
+
 prefixed_lookup_funcs = True
 
 
@@ -705,6 +1621,121 @@ def find_func(key, cfg):
             return func
 
 
+# ----------------------------------------------------------------------- Compile Backend
+# Instead of nesting partials we generate (and exec) the source of one flat function
+# per condition, with default lookups, operators and combinators inlined, i.e. w/o
+# stackframes and **kw repacking per atom.
+# a: looked up value, b: compare value:
+INLINE_OPS = {
+    operator.eq: '{a} == {b}',
+    operator.ne: '{a} != {b}',
+    operator.lt: '{a} < {b}',
+    operator.le: '{a} <= {b}',
+    operator.gt: '{a} > {b}',
+    operator.ge: '{a} >= {b}',
+    operator.is_: '{a} is {b}',
+    operator.is_not: '{a} is not {b}',
+    operator.contains: '{b} in {a}',
+    _in: '{a} in {b}',
+    truthy: 'True if {a} else False',
+    falsy: 'False if {a} else True',
+}
+
+# right hand side of the combinators, after the left one was evaluated into fr:
+# (same semantics than def comb)
+INLINE_COMBS = {
+    AND: 'False if not {l} else {r}',
+    OR: 'True if {l} else {r}',
+    AND_NOT: 'False if not {l} else not ({r})',
+    OR_NOT: 'True if {l} else not ({r})',
+    XOR: '{l} is not ({r})',
+}
+
+
+def compile_tree(tree, cfg, nfo):
+    """Compile backend for parse_cond(cond, compile=True)"""
+    ns = {'State': State, 'py_type': py_type}
+    body = emit_cond(tree, cfg, ns)
+    lines = ['def pycond_compiled(**kw):']
+    p = cfg.get('prefix')
+    if p:
+        ns['prefix'] = p
+        lines += [
+            "    if 'state_root' not in kw:",
+            "        kw['state_root'] = kw.get('state', State)",
+            "        kw['state'] = kw['state_root'].get(prefix)",
+        ]
+    if ns.get('have_state'):
+        lines.append("    state = kw.get('state', State)")
+    lines.append('    return %s' % body)
+    source = '\n'.join(lines) + '\n'
+    codes = cfg.get('code_cache')  # see save_bundle
+    code = None if codes is None else codes.get(source)
+    if code is None:
+        code = compile(source, '<pycond>', 'exec')
+        if codes is not None:
+            codes[source] = code
+    exec(code, ns)
+    nfo['source'] = source
+    return ns['pycond_compiled']
+
+
+def emit_cond(node, cfg, ns):
+    """Returns the python expression for a tree node"""
+    if not node:
+        return 'None'
+    typ = node['typ']
+    if typ == 'bool':
+        return str(bool(node['val']))
+    if typ == 'atom':
+        return emit_atom(node, cfg, ns)
+    l, r = emit_cond(node['left'], cfg, ns), emit_cond(node['right'], cfg, ns)
+    f_comb = COMB_OPS[node['op']]
+    tmpl = INLINE_COMBS.get(getattr(f_comb, 'op', None))
+    if tmpl is None:
+        # custom combinator, we have to call it:
+        return '%s(%s, %s, **kw)' % (
+            ns_add(ns, 'c', f_comb),
+            ns_add(ns, 'f', tree_func(node['left'], cfg)),
+            ns_add(ns, 'f', tree_func(node['right'], cfg)),
+        )
+    # left hand combs are bracketed, right hand not - conditional expressions chain w/o
+    # nesting that way, i.e. no parser limits for long [a and b or c ...] chains:
+    if node['left']['typ'] == 'comb':
+        l = '(%s)' % l
+    return tmpl.format(l=l, r=r)
+
+
+def emit_atom(spec, cfg, ns):
+    key, f_op = spec['key'], spec['f_op']
+    if spec['provider'] or cfg['lookup'] is not state_get or not is_str(key):
+        if spec['not'] or spec['rev'] or spec['acl']:
+            return '%s(**kw)' % ns_add(ns, 'a', spec['func'])
+        o, l = ns_add(ns, 'o', f_op), ns_add(ns, 'l', spec['lookup'])
+        return '%s(*%s(**kw))' % (o, l)
+
+    # default lookup, we inline it:
+    ns['have_state'] = True
+    a, b = 'state.get(%r)' % key, ns_add(ns, 'v', spec['val'])
+    if spec['acl']:
+        a = 'py_type(%s)' % a
+    if spec['rev']:
+        a, b = b, a
+    tmpl = INLINE_OPS.get(f_op)
+    if tmpl:
+        e = '(%s)' % tmpl.format(a=a, b=b)
+    else:
+        e = '%s(%s, %s)' % (ns_add(ns, 'o', f_op), a, b)
+    return '(not %s)' % e if spec['not'] else e
+
+
+def ns_add(ns, prefix, obj):
+    """adds obj to the namespace of the compiled function, returns its name"""
+    name = '%s%s' % (prefix, len(ns))
+    ns[name] = obj
+    return name
+
+
 # -------------------------------------------------------------------------- Public API
 # (def qualify has it's own section)
 
@@ -749,39 +1780,105 @@ def deserialize_str(cond, check_dict=False, **cfg):
             return dict([(k.strip(), v.strip()) for k, v in kvs]), cfg
 
     sep = cfg.pop('sep', KV_DELIM)
+    sc = cfg.get('struct_cache')  # see save_bundle
+    if sc is not None:
+        r = sc.get(cond)
+        if r is not None:
+            if r[1]:
+                cfg['deep'] = '.'
+            return marshal.loads(r[0]), cfg
+    src = cond
     if cond.startswith('deep:'):
         cond = cond.split('deep:', 1)[1].strip()
         cfg['deep'] = '.'
-    cond = tokenize(cond, sep=sep, brkts=brkts)
-    return to_struct(cond, cfg['brkts']), cfg
+    pos = []
+    cond = tokenize(cond, sep=sep, brkts=brkts, positions=pos)
+    cond = to_struct(cond, cfg['brkts'], positions=pos)
+    if sc is not None:
+        sc[src] = (marshal.dumps(cond), src.startswith('deep:'))
+    return cond, cfg
 
 
 def make_filter(cond, lookup=state_get, **cfg):
     """convenience function for filters"""
-    return lambda state, f=parse_cond(cond, lookup=lookup, **cfg)[0]: f(state=state)
+    return partial(f_filter, parse_cond(cond, lookup=lookup, **cfg)[0])
+
+
+def f_filter(f, state):
+    return f(state=state)
+
+
+class BuiltCond(partial):
+    """
+    A built condition (or qualifier).
+
+    Pickles into its source - the condition structure, i.e. w/o tokenizing again -
+    and is rebuilt at unpickling, via pyc_src: (<rebuild function>, <args>).
+    Partials are flattened at construction, so calling costs no extra stackframe.
+    """
+
+    def __reduce__(self):
+        return self.pyc_src
+
+
+def built_cond(f, rebuild, *src):
+    cfg = src[-1]
+    if 'struct_cache' in cfg or 'code_cache' in cfg:
+        src = src[:-1] + (dict([(k, v) for k, v in cfg.items() if k[-6:] != '_cache']),)
+    f = BuiltCond(f)
+    f.pyc_src = (rebuild, src)
+    return f
+
+
+def rebuild_cond(cond, lookup, cfg):
+    return parse_cond(cond, lookup, **cfg)[0]
+
+
+def rebuild_qualifier(conds, lookup, cfg):
+    return qualify(conds, lookup, **cfg)
 
 
 def parse_cond(cond, lookup=state_get, **cfg):
     """Main function.
     see tests
+
+    cache=True: Results are kept in the bounded build_cache (or any BuildCache
+    instance given), keyed by cond and cfg.
     """
+    cache = cfg.pop('cache', None)
+    if cache not in (None, False):
+        cache = build_cache if cache is True else cache
+        ck = cache.key(cond, lookup, cfg)
+        res = cache.get(ck)
+        if res is None:
+            res = parse_cond(cond, lookup, **cfg)
+            cache.set(ck, res)
+        return res
+
     nfo = {'keys': set()}
     if is_str(cond):
         cond, cfg = deserialize_str(cond, **cfg)
 
     if cfg.get('get_struct'):
         return cond, cfg
+    src = (cond, lookup, dict(cfg))
 
     if cfg.get('deep'):
         lookup = partial(state_get_deep, deep=cfg['deep'])
-    elif cfg.get('deep2'):
-        lookup = partial(Getters.get_deep2, deep=cfg['deep2'])
-    elif cfg.get('deep3'):
-        lookup = partial(Getters.get_deep_evl, deep=cfg['deep3'])
+    elif cfg.get('deep2') or cfg.get('deep3'):
+        gc = cfg.get('getter_cache')
+        gc = GetterCache() if gc is True else gc
+        kw = {'_c': gc} if gc not in (None, False) else {}
+        if cfg.get('deep2'):
+            lookup = partial(Getters.get_deep2, deep=cfg['deep2'], **kw)
+        else:
+            lookup = partial(Getters.get_deep_evl, deep=cfg['deep3'], **kw)
 
     cfg['lookup'] = lookup
-    cfg['lookup_args'] = sig_args(lookup)
+    cfg['lookup_args'] = lookup_args(lookup)
     cond = prepare(cond, cfg, nfo)
+    if cond is not None:
+        cond = built_cond(cond, rebuild_cond, *src)
     nfo['keys'] = sorted_keys(nfo['keys'])
     provider = cfg.get('ctx_provider')
     if provider:
@@ -806,6 +1903,8 @@ def complete_ctx_data(keys, provider):
 # where we store intermediate results, e.g. from lookup providers:
 CACHE_KEY = 'pyc_cache'
 CACHE_KEY_ASYNC = 'async'
+# memoized common subexpressions are cached under (CACHE_KEY_CSE, <id>):
+CACHE_KEY_CSE = 'cse'
 
 
 def pop_cache(kw):
@@ -834,6 +1933,22 @@ def pycond(cond, *a, **cfg):
     return parse_cond(cond, *a, **cfg)[0]
 
 
+def evaluate_many(cond, states, indices=False, **cfg):
+    """Evaluates one condition over many states, building it only once.
+
+    cond: condition (any format parse_cond accepts) or an already built one.
+    Built here it's compiled (compile=True), unless given otherwise or with options
+    of the partial chain (CHAIN_OPTS).
+    Returns a list of bools or, with indices=True, the indices of the matching states.
+    """
+    if not callable(cond):
+        cfg.setdefault('compile', not any([cfg.get(k) for k in CHAIN_OPTS]))
+    f = cond if callable(cond) else parse_cond(cond, **cfg)[0]
+    if indices:
+        return [i for i, s in enumerate(states) if f(state=s)]
+    return [bool(f(state=s)) for s in states]
+
+
 def run_all_ops_thru(f_hook):
     """wraps ALL operator evals within a custom function"""
     global OPS_HK_APPLIED
@@ -847,6 +1962,7 @@ def run_all_ops_thru(f_hook):
     for k in ops:
         OPS[k] = partial(ops_wrapper, OPS[k], f_hook)
     OPS_HK_APPLIED = f_hook
+    build_cache.clear()
 
 
 def py_type(v):
@@ -875,103 +1991,117 @@ def py_type(v):
 KV_DELIM = ' '  # default seperator for strings
 
 
-def tokenize(cond, sep=KV_DELIM, brkts=('[', ']')):
-    """walk throug a single string expression"""
-    # '[[ a' -> '[ [ a', then split
-    esc, escaped, have_apo_seps = [], [], False
+class ParseError(Exception):
+    """Build time exception, for string conditions"""
 
-    # remove the space from the ops here, comb ops are like 'and_not':
-    for op in COMB_OPS:
-        if '_' in op:
-            cond = cond.replace(op.replace('_', sep), op)
-    for op, repl in NEG_REV.items():
-        cond = cond.replace(op, repl)
 
-    cond = [c for c in cond]
-    r = []
-    while cond:
-        c = cond.pop(0)
-        have_apo = False
-        for apo in '"', "'":
-            if c != apo:
-                continue
-            have_apo = True
-            r += 'str:'
-            while cond and cond[0] != apo:  # and r[-1] != '\\':
-                c = cond.pop(0)
-                if c == sep:
-                    c = '__sep__'
-                    have_apo_seps = True
-                r += c
-            if cond:
-                cond.pop(0)
+def tokenize(cond, sep=KV_DELIM, brkts=('[', ']'), positions=None):
+    """walk throug a single string expression - in one pass.
+
+    positions: optional list, filled with the start offsets of the tokens
+    """
+    r, pos = [], []
+    cur, start = [], 0
+    # did we write anything yet, was the last write a separator:
+    written, at_sep = False, False
+    i, n = 0, len(cond)
+    while i < n:
+        c = cond[i]
+        if c == sep:
+            r.append(''.join(cur))
+            pos.append(start)
+            cur, start = [], i + 1
+            written = at_sep = True
+            i += 1
             continue
-        if have_apo:
+        written, at_sep = True, False
+        if c == '"' or c == "'":
+            # quoted - no separators or brackets within, and no autoconv later:
+            j = cond.find(c, i + 1)
+            j = n if j == -1 else j
+            cur.append('str:')
+            cur.append(cond[i + 1 : j])
+            i = j + 1
             continue
-
-        # esape:
         if c == '\\':
-            c = cond.pop(0)
-            if c in escaped:
-                key = esc[escaped.index(c)]
-            else:
-                escaped.append(c)
-                key = '__esc__%s' % len(escaped)
-                esc.append(key)
-            r += key
+            if i + 1 == n:
+                raise ParseError('Nothing to escape at position %s' % i)
+            cur.append(cond[i + 1])
+            i += 2
             continue
-
-        isbr = False
         if c in brkts:
-            isbr = True
-            if r and r[-1] != sep:
-                r += sep
-        r += c
-        if isbr and cond and cond[0] != sep:
-            r += sep
-
-    cond = ''.join(r)
-
-    # replace back the escaped stuff:
-    if not esc:
-        # be fast:
-        res = cond.split(sep)
-    else:
-        # fastets before splitting:
-        cond = cond.replace(sep, '__ESC__')
-        for i in range(len(esc)):
-            cond = cond.replace(esc[i], escaped[i])
-        res = cond.split('__ESC__')
-    # replace back the previously excluded stuff in apostrophes:
-    if have_apo_seps:
-        res = [part.replace('__sep__', sep) for part in res]
-    return res
-
+            if written and cur and not at_sep:
+                r.append(''.join(cur))
+                pos.append(start)
+                cur, start = [], i
+            cur.append(c)
+            if i + 1 < n and cond[i + 1] != sep:
+                r.append(c)
+                pos.append(i)
+                cur, start = [], i + 1
+                at_sep = True
+            i += 1
+            continue
+        cur.append(c)
+        i += 1
+    r.append(''.join(cur))
+    pos.append(start)
+    r, pos = merge_ops(r, pos, sep)
+    if positions is not None:
+        positions.extend(pos)
+    return r
+
 
-def to_struct(cond, brackets='[]'):
-    """Recursively scanning through a tokenized expression and building the
-    condition function step by step
+def merge_ops(tokens, pos, sep):
+    """the multi word ops, e.g. 'and not', are replaced by e.g. 'and_not'"""
+    ops, merged = {}, [op for op in COMB_OPS if '_' in op]
+    if sep == ' ':
+        merged += list(NEG_REV.values())
+    for op in merged:
+        parts = op.split('_')
+        ops.setdefault(parts[0], []).append(parts)
+    r, p, i, n = [], [], 0, len(tokens)
+    while i < n:
+        t = tokens[i]
+        for parts in ops.get(t, ()):
+            if tokens[i : i + len(parts)] == parts:
+                t = '_'.join(parts)
+                break
+        else:
+            parts = (t,)
+        r.append(t)
+        p.append(pos[i])
+        i += len(parts)
+    return r, p
+
+
+def to_struct(cond, brackets='[]', positions=None):
+    """Scanning through a tokenized expression, building the nested lists of the
+    bracketed parts.
+
+    positions: the start offsets of the tokens, for error messages
     """
     openbrkt, closebrkt = brackets
-    expr1 = None
-    res = []
-    while cond:
-        part = cond.pop(0)
+    stack, opened = [[]], []
+
+    def at(i):
+        return 'position %s' % positions[i] if positions else 'token %s' % i
+
+    for i, part in enumerate(cond):
         if part == openbrkt:
-            lev = 1
-            inner = []
-            while not (lev == 1 and cond[0] == closebrkt):
-                inner.append(cond.pop(0))
-                if inner[-1] == openbrkt:
-                    lev += 1
-                elif inner[-1] == closebrkt:
-                    lev -= 1
-            cond.pop(0)
-            res.append(to_struct(inner, brackets))
+            stack.append([])
+            opened.append(i)
+        elif part == closebrkt:
+            if not opened:
+                raise ParseError('Unbalanced closing bracket at %s' % at(i))
+            inner = stack.pop()
+            opened.pop()
+            stack[-1].append(inner)
         else:
-            res.append(part)
-
-    return res
+            stack[-1].append(part)
+    if opened:
+        raise ParseError('Unclosed bracket at %s' % at(opened[-1]))
+    return stack[0]
 
 
 # ----------------------------------------------------------------------------- qualify
@@ -1033,6 +2163,26 @@ def is_named_listed_set_of_conds(cond):
     return True
 
 
+def deserialize_conds(conds, cfg):
+    """
+    conds as given to qualify, with the condition strings as structures (walking
+    like init_conds). The source of the qualifier (pickling), i.e. no tokenizing at
+    rebuild.
+    """
+    if _is(conds, str):
+        return deserialize_str(conds, **cfg)[0]
+    if _is(conds, dict):
+        return dict([(k, deserialize_conds(v, cfg)) for k, v in conds.items()])
+    if not _is(conds, list) or not conds:
+        return copy.deepcopy(conds)
+    cond, is_single = norm(conds)
+    if is_single:
+        return copy.deepcopy(conds)
+    if is_named_listed_set_of_conds(cond):
+        return [[k, deserialize_conds(c, cfg)] for k, c in cond]
+    return [deserialize_conds(c, cfg) for c in conds]
+
+
 def init_conds(conds, cfg, built, prefix=()):
     """
     Recurses into conds
@@ -1103,7 +2253,8 @@ def add_cache(n, kw, into):
     if c:
         # e.g. add_cache = "payload", then add there:
         r = state_get_deep(n, 0, {}, into)[0] if n is not True else into
-        r.update(c)
+        # w/o the memoized common subexpressions and lookups in flight:
+        r.update([(k, v) for k, v in c.items() if not _is(k, tuple) and not _is(v, asyncio.Future)])
 
 
 def run_conds(
@@ -1114,12 +2265,21 @@ def run_conds(
     add_cached=None,
     into=None,
     match_any=True,
+    index=None,
+    shared=None,
+    order=None,
     **kw,
 ):
     """
     In data path (hot). The function which qualify returns, ready for data push.
     kw has also the cfg
+
+    conds are in dependency order, the results of those in shared (referred to by
+    others) are cached, so evaluated once per item. order: the original order, if
+    different.
     """
+    if index:
+        conds = index_candidates(data, conds, index, kw)
 
     if is_single:
         r = built['root'][0](state=data, **kw)
@@ -1133,9 +2293,9 @@ def run_conds(
         return f
 
     r = {}
-    only_root = kw.get('root') not in (None, False)
+    n_root = root_count(kw.get('root'))
     matched = []
-    for k, v in conds:
+    for i, (k, v) in enumerate(conds):
         b = built[k]
         if _is(v, list):
             r[k] = [
@@ -1143,20 +2303,33 @@ def run_conds(
                 for i, c in zip(range(len(v)), v)
             ]
         else:
-            r[k] = m = run_conds(data, v, b, is_single, **kw)
+            if shared and k in shared:
+                m = kw[CACHE_KEY].get(k, nil)
+                if m is nil:
+                    m = kw[CACHE_KEY][k] = run_conds(data, v, b, is_single, **kw)
+            elif _is(v, dict):  # the normal case, w/o the recursion:
+                m = b[0](state=data, **kw)
+            else:
+                m = run_conds(data, v, b, is_single, **kw)
+            r[k] = m
             if m:
                 matched.append(k)
                 if not match_any:
                     break
 
         # user wants only partial evaluation?
-        if only_root:
-            for k, v in conds[1:]:
+        if n_root and i + 1 == n_root:
+            for k, v in conds[n_root:]:
                 vv = kw[CACHE_KEY].get(k)
                 if vv is not None:
                     r[k] = vv
             break
 
+    if index:
+        r = index_fill(r, index, match_any)
+    if order:
+        r = dict([(k, r[k]) for k in order if k in r])
+
     if add_cached:
         # True: add the cached content into the condition results:
         if into and add_cached is not True:
@@ -1174,6 +2347,120 @@ def run_conds(
     return r
 
 
+async def aio_run_conds(
+    data,
+    conds,
+    built,
+    is_single,
+    add_cached=None,
+    into=None,
+    match_any=True,
+    index=None,
+    shared=None,
+    order=None,
+    **kw,
+):
+    """
+    qualify(conds, aio=True): run_conds for awaitable conditions.
+
+    The named conditions are evaluated concurrently - except when a root is given or
+    with match_any=False, then in order.
+    Those referred to by others (shared) are evaluated once per item: Their futures
+    are in the cache, awaited also by the sub_cond lookups.
+    """
+    if index:
+        conds = index_candidates(data, conds, index, kw)
+    cache = kw[CACHE_KEY]
+
+    if is_single:
+        r = await built['root'][0](state=data, **kw)
+        if add_cached:
+            add_cache(add_cached, kw, data)
+        return r
+
+    n_root = root_count(kw.get('root'))
+    if n_root or not match_any:
+        r = {}
+        for i, (k, v) in enumerate(conds):
+            if shared and k in shared and not _is(v, list):
+                m = cache.get(k, nil)
+                if _is(m, asyncio.Future):
+                    m = (await aio_cached(m))[0]
+                elif m is nil:
+                    m = cache[k] = await aio_run_cond(data, v, built[k], kw)
+                r[k] = m
+            else:
+                r[k] = m = await aio_run_cond(data, v, built[k], kw)
+            if n_root and i + 1 == n_root:
+                for k, v in conds[n_root:]:
+                    vv = cache.get(k)
+                    if vv is not None and not _is(vv, asyncio.Future):
+                        r[k] = vv
+                break
+            if m and not match_any and not _is(v, list):
+                break
+    else:
+        res = []
+        for k, v in conds:
+            if shared and k in shared and not _is(v, list):
+                m = cache.get(k, nil)
+                if m is nil:
+                    c = aio_run_shared(data, v, built[k], kw, cache, k)
+                    m = cache[k] = asyncio.ensure_future(c)
+                res.append(aio_value(m))
+            else:
+                res.append(aio_run_cond(data, v, built[k], kw))
+        r = dict(zip([k for k, v in conds], await asyncio.gather(*res)))
+    if index:
+        r = index_fill(r, index, match_any)
+    if order:
+        r = dict([(k, r[k]) for k in order if k in r])
+
+    if add_cached:
+        if into and add_cached is not True:
+            m = data
+        else:
+            add_cached = True
+            m = r
+        add_cache(add_cached, kw, m)
+
+    if into:
+        data[into] = r
+        return data
+    return r
+
+
+async def aio_run_shared(data, v, b, kw, cache, k):
+    """a shared named condition, as (result, None) like the lookups, see aio_cached"""
+    r = cache[k] = await aio_run_cond(data, v, b, kw)
+    return r, None
+
+
+async def aio_value(m):
+    """the value of a shared condition, in flight or not"""
+    return (await aio_cached(m))[0] if _is(m, asyncio.Future) else m
+
+
+async def aio_run_cond(data, v, b, kw):
+    if _is(v, list):
+        return list(await asyncio.gather(*[c[0](state=data, **kw) for c in b]))
+    return await b[0](state=data, **kw)
+
+
+async def aio_run_many(run, items, indices=False, into=None):
+    """run_many for qualify(conds, aio=True): the items are run concurrently"""
+    res = await asyncio.gather(*[run(x, pyc_cache={}) for x in items])
+    if not indices:
+        return list(res)
+    r = []
+    for i, m in enumerate(res):
+        if into:
+            m = m[into]
+        if any(m.values()) if _is(m, dict) else m:
+            r.append(i)
+    return r
+
+
 def qualify(conds, lookup=state_get, get_type=False, **cfg):
     """
     conds = set of conditions in any acceptable format or a single one.
@@ -1181,7 +2468,17 @@ def qualify(conds, lookup=state_get, get_type=False, **cfg):
     """
     if _is(conds, str):
         conds, cfg = deserialize_str(conds, check_dict=True, **cfg)
+    # the build cache won't hit: sub conditions are bound to this qualifier:
+    cfg.pop('cache', None)
+    # tokenized once, the structures are the source (pickling) and built (prepare
+    # works on a copy):
+    src = (deserialize_conds(conds, cfg), lookup, dict(cfg))
+    conds = src[0]
+    if 'lookup_provider_dict' in cfg:
+        # we add the sub conditions there:
+        src[2]['lookup_provider_dict'] = dict(cfg['lookup_provider_dict'])
     built = {}  # store all built named conditions here
+    init_qualify_cfg(cfg)
     conds, is_single, is_named_listed = init_conds(conds, cfg, built)
     if is_named_listed:
         subs = [c[0] for c in conds]
@@ -1190,11 +2487,7 @@ def qualify(conds, lookup=state_get, get_type=False, **cfg):
 
     # now we provide the sub cond results as normal lookup dict functions, i.e. with cacheing:
     lpd = cfg.setdefault('lookup_provider_dict', {})
-
-    def sub_cond(key, v, cfg, state=State, _built=built, **kw):
-        res = _built[key][0](state=state, **kw)
-        return res, v
-
+    sub_cond = sub_cond_func(built)
     lpd.update(dict([(sub, {'func': sub_cond}) for sub in subs]))
 
     # handle the case of the conds given as list but w/o names:
@@ -1208,28 +2501,729 @@ def qualify(conds, lookup=state_get, get_type=False, **cfg):
     if is_single:
         built = {'root': b}
         conds = [['root', conds]]
+    return make_qualifier(conds, built, is_single, cfg, src, get_type)
+
+
+def init_qualify_cfg(cfg):
+    check_modes(cfg)  # before building any
+    if cfg.get('cse') is True:
+        cfg['cse'] = {}  # registry of the common subexpressions, see cse_func
+    if cfg.get('getter_cache') is True:
+        cfg['getter_cache'] = GetterCache()  # one for all conds of this qualifier
+    if cfg.get('instrument') is True:
+        cfg['instrument'] = Stats()  # dito
+    if cfg.get('incremental') is True:
+        cfg['incremental'] = {'by_key': {}, 'n': 0}  # see dirty_func
+    if cfg.get('multi_regex', True) is True:
+        cfg['multi_regex'] = {}  # key -> patterns, see multi_regex_atom
+
 
+def sub_cond_func(built):
+    """The lookup provider function for named conditions referring to others"""
+
+    def sub_cond(key, v, cfg, state=State, _built=built, **kw):
+        # the current version of the named conditions, see qualifier_update:
+        res = kw.get('pyc_built', _built)[key][0](state=state, **kw)
+        return res, v
+
+    sub_cond.pyc_sub_cond = True  # not prefetched, see prefetch_func
+    return sub_cond
+
+
+def make_qualifier(conds, built, is_single, cfg, src, get_type=False):
+    """The qualify function, for the built named conditions"""
     root = cfg.get('root')
     if 'root' in built and root is None:
         root = cfg['root'] = 'root'
 
-    if root is not None:
-        # put it first, we'll break after evaling that:
-        c = []
-        for k, v in conds:
-            if k == root:
-                c.insert(0, [k, v])
-            else:
-                c.append([k, v])
-        conds = c
-    f = partial(run_conds, conds=conds, built=built, is_single=is_single, **cfg)
-    f = partial(add_cache_then_run, f)
+    graph = None if is_single else cond_graph(conds, built, cfg)
+    sched = {'conds': conds} if is_single else cond_schedule(conds, built, cfg, graph)
+    if cfg.get('index'):
+        # a rule set with a root is not evaluated per rule, nothing to index then:
+        ok = not (is_single or root is not None or cfg.get('prefix'))
+        cfg['index'] = build_index(sched['conds'], built) if ok else None
+
+    rc, rm = (aio_run_conds, aio_run_many) if cfg.get('aio') else (run_conds, run_many)
+    if not is_single:
+        sched['pyc_built'] = built  # for sub_cond
+    run = partial(rc, built=built, is_single=is_single, **dict(cfg, **sched))
+    f = built_cond(partial(add_cache_then_run, run), rebuild_qualifier, *src)
+    f.many = partial(rm, run, into=cfg.get('into'))
+    if cfg.get('instrument') not in (None, False):
+        f.stats = cfg['instrument']
+    if not is_single:
+        f.pyc_graph = graph  # for the updates
+        f.update_lock = threading.Lock()
+        f.add = partial(qualifier_update, f, 'add')
+        f.replace = partial(qualifier_update, f, 'replace')
+        f.remove = partial(qualifier_update, f, 'remove')
     if get_type:
         return f, is_single
     else:
         return f
 
 
+def root_count(root):
+    """qualify(conds, root=...): A name or a list of names"""
+    if root in (None, False):
+        return 0
+    return len(root) if _is(root, list) else 1
+
+
+def cond_graph(conds, built, cfg):
+    """name -> the names of the other named conditions it refers to (':<name>')"""
+    names = [k for k, v in conds]
+    pos = dict(zip(names, range(len(names))))
+    return dict([(k, cond_deps(built[k], cfg, pos)) for k in names])
+
+
+def cond_deps(b, cfg, pos):
+    """The names (in pos, in given order) the built condition b refers to"""
+    return sorted([n for n in refs(b, cfg) if n in pos], key=pos.get)
+
+
+def topo_order(names, graph):
+    """names with the ones they depend on first, else in given order. Raises on cycles"""
+    order, done, path = [], set(), []
+
+    def visit(k):
+        if k in done:
+            return
+        if k in path:
+            cycle = path[path.index(k) :] + [k]
+            raise ValueError('Cyclic condition references: %s' % ' -> '.join(map(str, cycle)))
+        path.append(k)
+        for d in graph.get(k, ()):
+            visit(d)
+        path.pop()
+        done.add(k)
+        order.append(k)
+
+    for k in names:
+        visit(k)
+    return order
+
+
+def cond_schedule(conds, built, cfg, graph=None):
+    """
+    The run_conds arguments for the evaluation order of the named conditions, built
+    from their dependency graph:
+
+    - conds: dependencies first (not with match_any=False, that one stays in order)
+    - root(s) first, then we break after evaluating those - what they need is
+      evaluated (lazily) over the sub_cond lookups.
+    - shared: those referred to by others, their results are cached per item
+    - order: the given order for the results, if different
+    """
+    if graph is None:
+        graph = cond_graph(conds, built, cfg)
+    names = [k for k, v in conds]
+    order = topo_order(names, graph)  # always, for the cycle check
+    root = cfg.get('root')
+    if root_count(root):
+        roots = root if _is(root, list) else [root]
+        missing = [r for r in roots if r not in graph]
+        if missing:
+            raise KeyError('Root condition(s) not found: %s' % missing)
+        roots = [k for k in order if k in roots]
+        order = roots + [k for k in names if k not in roots]
+    elif cfg.get('match_any', True) is False:
+        order = names
+    d = dict(conds)
+    shared = set([n for deps in graph.values() for n in deps])
+    return {
+        'conds': [[k, d[k]] for k in order],
+        'shared': shared or None,
+        'order': names if order != names else None,
+    }
+
+
+def qualifier_update(f, mode, name, cond=None):
+    """
+    qualify(conds).add(name, cond) / .replace(name, cond) / .remove(name):
+    Changing a named condition in place.
+
+    Only the changed one is built, then a new run function, with a new dict of the
+    built conditions (and index), swapped in. The old one is not changed, i.e.
+    running evaluations see either the old or the new rule set.
+    Conditions referring to the changed one (':<name>') see the new one, since
+    sub_cond resolves through the built conditions of the run (kw pyc_built).
+    A condition referred to by others can't be removed.
+    """
+    with f.update_lock:
+        run = f.args[0]
+        kw = dict(run.keywords)
+        conds, built, cfg = kw.pop('conds'), kw.pop('built'), kw
+        if cfg.pop('order', None):
+            d = dict(conds)
+            conds = [[k, d[k]] for k in run.keywords['order']]
+        cfg.pop('shared', None)
+        names = [k for k, v in conds]
+        if (mode == 'add') is (name in built):
+            raise KeyError('%s: %s %s' % (mode, name, 'exists' if name in built else 'not found'))
+        built, graph = dict(built), dict(f.pyc_graph)  # the new version
+        lpd = cfg['lookup_provider_dict'] = dict(cfg['lookup_provider_dict'])
+        if mode == 'remove':
+            users = [k for k in names if k != name and name in graph[k]]
+            if users:
+                raise ValueError('Condition %s is referred to by %s' % (name, users))
+            new = [c for c in conds if c[0] != name]
+            del built[name], graph[name]
+            lpd.pop(name, None)
+        else:
+            tmp = {}
+            c = init_conds({name: cond}, cfg, tmp)[0]
+            build(c, cfg, into=tmp)
+            if mode == 'add':
+                new = conds + c
+            else:
+                new = [c[0] if k == name else [k, v] for k, v in conds]
+            built[name] = tmp[name]
+            # only the edges of the changed one are new, cycles only over it:
+            pos = dict(zip([k for k, v in new], range(len(new))))
+            graph[name] = cond_deps(built[name], cfg, pos)
+            topo_order([name], graph)
+            lpd[name] = {'func': sub_cond_func(built)}
+        sched = cond_schedule(new, built, cfg, graph)
+        sched['pyc_built'] = built
+        ix = cfg.get('index')
+        if ix:
+            atoms = dict([(k, v) for k, v in ix['atoms'].items() if k != name])
+            cfg['index'] = build_index(sched['conds'], built, atoms)
+        run = partial(run.func, built=built, **dict(cfg, **sched))
+        # the swap:
+        f.__setstate__((f.func, (run,), f.keywords, f.__dict__))
+        f.many = partial(f.many.func, run, *f.many.args[1:], **f.many.keywords)
+        f.pyc_graph = graph
+        update_src(f.pyc_src[1][0], mode, name, deserialize_conds(cond, cfg))
+
+
+class IncrementalState:
+    """
+    Keeping the results of a qualifier, built with qualify(conds, incremental=True),
+    for a long lived state, re-evaluating only what depends on changed keys:
+
+        s = IncrementalState(q, state)  # evaluates all
+        state['a'] = 2
+        s.update(['a'])  # -> {<name>: <new result>} for the changed results
+
+    Node results are kept per state (memo), a change drops those of the nodes
+    depending on the changed (top level) keys, then only the conditions using them
+    or lookup providers (incl. other conditions) are evaluated.
+    """
+
+    def __init__(self, q, state):
+        kw = dict(q.args[0].keywords)
+        self.conds, self.built = kw.pop('conds'), kw.pop('built')
+        kw.pop('shared', None), kw.pop('order', None)
+        self.cfg, self.reg = kw, kw.get('incremental')
+        if not _is(self.reg, dict):
+            raise ValueError('Qualifier not built with incremental=True')
+        self.state, self.memo, self.results = state, {}, {}
+        self.cond_keys = {}  # name -> root keys, None if using lookup providers
+        for k, v in self.conds:
+            b = self.built[k]
+            keys = set()
+            for atom in [a for c in (b if _is(b, list) else [b]) for a in tree_atoms(c[1]['tree'])]:
+                if atom['provider']:
+                    keys = None
+                    break
+                keys.add(root_key(atom['key'], kw))
+            self.cond_keys[k] = keys
+        if not self.reg['n'] and any(self.cond_keys.values()):
+            # e.g. built by another backend, re-evaluating all conditions in full:
+            raise ValueError('Qualifier has no memoized nodes, see incremental=True')
+        self.update()
+
+    def update(self, changed=None):
+        """changed: keys of the state which changed, None: all"""
+        if changed is None:
+            self.memo.clear()
+            names = [k for k, v in self.conds]
+        else:
+            changed = set([root_key(k, self.cfg) for k in changed])
+            for k in changed:
+                for nid in self.reg['by_key'].get(k, ()):
+                    self.memo.pop(nid, None)
+            names = [
+                k
+                for k, v in self.conds
+                if self.cond_keys[k] is None or self.cond_keys[k] & changed
+            ]
+        res, kw = {}, dict(self.cfg)
+        kw['pyc_memo'] = self.memo
+        for k in names:
+            b = self.built[k]
+            kw[CACHE_KEY] = {}
+            if _is(b, list):
+                r = [c[0](state=self.state, **kw) for c in b]
+            else:
+                r = b[0](state=self.state, **kw)
+            if k not in self.results or self.results[k] != r:
+                self.results[k] = res[k] = r
+        return res
+
+
+def refs(b, cfg):
+    """Names of lookup providers, i.e. also other conditions, used by built condition(s) b"""
+    if _is(b, list):
+        return set().union(*[refs(c, cfg) for c in b])
+    req_p = prefixed_lookup_funcs and cfg.get('prefixed_lookup_funcs', True)
+    keys = [k for k in b[1]['keys'] if _is(k, str) and (k[:1] == ':' or not req_p)]
+    return set([k.lstrip(':') for k in keys])
+
+
+def update_src(src, mode, name, cond):
+    """keeping the conds of the qualifier in sync, for pickling"""
+    if _is(src, dict):
+        if mode == 'remove':
+            src.pop(name, None)
+        else:
+            src[name] = cond
+        return
+    if _is(src, list):
+        i = [n for n, c in enumerate(src) if _is(c, list) and c and c[0] == name]
+        if mode == 'remove':
+            src[:] = [c for n, c in enumerate(src) if n not in i]
+        elif i:
+            src[i[0]] = [name, cond]
+        else:
+            src.append([name, cond])
+
+
+def build_index(conds, built, atoms=None):
+    """
+    qualify(conds, index=True): Indexing the named conditions by the first eq or in
+    atom, which must be true for the whole condition to be true (e.g. 'type eq order'
+    in 'type eq order and [a or b]').
+
+    Per item only the candidates are evaluated then, i.e. the conditions with an
+    indexed value matching the item's one plus all w/o indexable atom.
+    The results of the others are known to be False and are filled in as such, so
+    the qualify result is the same as w/o index.
+    """
+    keys, always, atoms = {}, [], {} if atoms is None else atoms
+    for i, (k, v) in zip(range(len(conds)), conds):
+        atom = atoms.get(k)
+        if atom is None and k not in atoms:
+            atom = atoms[k] = None
+            if _is(v, dict) and 'cond' in v:
+                atom = atoms[k] = index_atom(built[k][1]['tree'])
+        if not atom:
+            always.append(i)
+            continue
+        vals = atom['val'] if is_in_op(atom['f_op']) else (atom['val'],)
+        # same key, same lookup -> we keep the one of the first atom:
+        ki = keys.setdefault(atom['key'], [atom['lookup'], {}, []])
+        for val in vals:
+            ki[1].setdefault(val, []).append(i)
+        ki[2].append(i)
+    false = dict.fromkeys([k for k, v in conds], False)
+    return {'keys': list(keys.values()), 'always': always, 'atoms': atoms, 'false': false}
+
+
+def index_atom(node):
+    """The first indexable atom which must be true for node to be true"""
+    if not node:
+        return
+    if node['typ'] == 'comb':
+        if node['op'] not in ('and', 'and_not'):
+            return
+        return index_atom(node['left']) or (
+            index_atom(node['right']) if node['op'] == 'and' else None
+        )
+    if node['typ'] != 'atom':
+        return
+    if node['provider'] or node['not'] or node['rev'] or node['acl']:
+        return
+    vals = (node['val'],)
+    if is_in_op(node['f_op']):
+        vals = node['val']
+        if not _is(vals, (list, tuple, set, frozenset)):
+            return
+    elif node['f_op'] is not operator.eq:
+        return
+    try:
+        [hash(v) for v in vals]
+    except TypeError:
+        return
+    return node
+
+
+def index_candidates(data, conds, index, kw):
+    pos = set(index['always'])
+    for lookup, vals, all_pos in index['keys']:
+        v = lookup(state=data, **kw)[0]
+        try:
+            p = vals.get(v)
+        except TypeError:
+            # unhashable value, can't tell:
+            p = all_pos
+        if p:
+            pos.update(p)
+    return [conds[i] for i in sorted(pos)]
+
+
+def index_fill(r, index, match_any):
+    """The results of the candidates, with False for the others (same as w/o index)"""
+    if match_any:
+        f = dict(index['false'])
+        f.update(r)
+        return f
+    f = {}
+    for k in index['false']:
+        m = f[k] = r.get(k, False)
+        # stop at the first match, as the run w/o index:
+        if m and not _is(m, list):
+            break
+    return f
+
+
+def run_many(run, items, indices=False, into=None, errors=False):
+    """
+    qualify(...).many(items): Running a batch of items through the qualifier.
+
+    The setup is done once per batch: The run function is called w/o the qualify
+    and run partials, with one kw dict for all items (and a new cache per item).
+
+    Returns the list of results or, with indices=True, the indices of the items for
+    which any condition matched.
+    errors=True: Exceptions (also Async, Completed) are returned as the item's result.
+    """
+    f, kw = run.func, dict(run.keywords)
+    plan = many_plan(run)
+    if plan:
+        f = partial(run_planned, plan, kw.get('into'))
+        for k in RUN_CONDS_ARGS:
+            kw.pop(k, None)
+    res = []
+    for x in items:
+        kw[CACHE_KEY] = {}
+        if not errors:
+            res.append(f(x, **kw))
+            continue
+        try:
+            res.append(f(x, **kw))
+        except Exception as ex:
+            res.append(ex)
+    if not indices:
+        return res
+    r = []
+    for i, m in enumerate(res):
+        if _is(m, Exception):
+            continue
+        if into:
+            m = m[into]
+        if any(m.values()) if _is(m, dict) else m:
+            r.append(i)
+    return r
+
+
+RUN_CONDS_ARGS = ('conds', 'built', 'is_single', 'add_cached', 'into', 'match_any', 'index', 'shared', 'order')
+
+
+def many_plan(run):
+    """
+    run_many: [name, built function, is shared] of the named conditions, for
+    run_planned, when run_conds has nothing else to do for them.
+    """
+    kw = run.keywords
+    if run.func is not run_conds or kw.get('is_single') or root_count(kw.get('root')):
+        return
+    if kw.get('match_any', True) is not True:
+        return
+    if any([kw.get(k) for k in ('add_cached', 'index', 'order')]):
+        return
+    if not all([_is(v, dict) for k, v in kw['conds']]):
+        return
+    shared = kw.get('shared') or ()
+    return [(k, kw['built'][k][0], k in shared) for k, v in kw['conds']]
+
+
+def run_planned(plan, into, data, **kw):
+    """run_conds for a many_plan"""
+    r, c = {}, kw[CACHE_KEY]
+    for k, f, shared in plan:
+        if shared:
+            m = c.get(k, nil)
+            if m is nil:
+                m = c[k] = f(state=data, **kw)
+        else:
+            m = f(state=data, **kw)
+        r[k] = m
+    if into:
+        data[into] = r
+        return data
+    return r
+
+
+def qualify_parallel(
+    conds, items, workers=None, chunksize=500, ordered=True, mp_context=None, **cfg
+):
+    """
+    Running items through qualify(conds, **cfg) in worker processes.
+
+    conds and cfg are sent to the workers (i.e. must be picklable, lookup providers
+    importable), each builds its own qualifier. items are sent in chunks, max
+    2 * workers of them in flight (items may be an endless iterator).
+
+    Yields the qualifier results - with ordered=False in order of completion, then
+    use e.g. into, to have the results within the items.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    # tokenized once here, not in every worker:
+    if _is(conds, str):
+        conds, cfg = deserialize_str(conds, check_dict=True, **cfg)
+    conds = deserialize_conds(conds, cfg)
+    workers = workers or os.cpu_count() or 1
+    ex = ProcessPoolExecutor(
+        workers,
+        mp_context=mp_context,
+        initializer=qualify_worker_init,
+        initargs=(conds, cfg),
+    )
+    return pool_map(ex, qualify_worker_run, items, chunksize, 2 * workers, ordered)
+
+
+def pool_map(ex, f, items, chunksize, window, ordered=True):
+    """
+    Yields the results of f(chunk) for chunks of items, run in executor ex, with max
+    window chunks in flight. Shuts ex down at the end.
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED
+    from itertools import islice
+
+    items, pending = iter(items), deque()
+    try:
+        while True:
+            while len(pending) < window:
+                chunk = list(islice(items, chunksize))
+                if not chunk:
+                    break
+                pending.append(ex.submit(f, chunk))
+            if not pending:
+                return
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done = wait(pending, return_when=FIRST_COMPLETED)[0]
+                pending = deque([fut for fut in pending if fut not in done])
+            for fut in done:
+                for r in fut.result():
+                    yield r
+    finally:
+        for fut in pending:
+            fut.cancel()
+        ex.shutdown(wait=True)
+
+
+def qualify_stream(rules, workers=None, chunksize=200, get_type=False, **cfg):
+    """
+    Builds a qualifier from named conditions, streamed one at a time from a JSON Lines
+    file (path) or an iterable of lines (or of decoded rules):
+
+        {"name": "r1", "cond": "a eq 1"} or {"r1": "a eq 1"} or ["r1", "a eq 1"]
+
+    Rules failing to build are skipped, with (<name or line number>, exception) in
+    .errors of the qualifier. Rules referring to later ones (':<name>') are built
+    after all others, i.e. are evaluated after them.
+
+    workers=<n>: The rules are decoded and tokenized in n worker processes.
+    """
+    cfg.pop('cache', None)
+    src = (OrderedDict(), state_get, dict(cfg))
+    if 'lookup_provider_dict' in cfg:
+        src[2]['lookup_provider_dict'] = dict(cfg['lookup_provider_dict'])
+    init_qualify_cfg(cfg)
+    built, conds, errors, pending = {}, [], [], []
+    lpd = cfg.setdefault('lookup_provider_dict', {})
+    sub_cond = sub_cond_func(built)
+
+    def add(name, cond):
+        if name in built:
+            return errors.append((name, Exception('Duplicate rule name: %s' % name)))
+        lpd[name] = {'func': sub_cond}
+        try:
+            c = init_conds({name: cond}, cfg, built)[0]
+            build(c, cfg, into=built)
+        except Exception as ex:
+            lpd.pop(name, None)
+            built.pop(name, None)
+            if _is(ex, MissingLookupFunction):
+                return pending.append((name, cond, ex))
+            return errors.append((name, ex))
+        conds.extend(c)
+        src[0][name] = cond
+
+    for name, cond in stream_rules(rules, workers, chunksize, cfg, errors):
+        add(name, cond)
+    n = None
+    while pending and len(pending) != n:
+        n, p = len(pending), pending[:]
+        del pending[:]
+        for name, cond, ex in p:
+            add(name, cond)
+    errors.extend([(name, ex) for name, cond, ex in pending])
+    f = make_qualifier(conds, built, False, cfg, src)
+    f.errors = errors
+    return (f, False) if get_type else f
+
+
+def stream_rules(rules, workers, chunksize, cfg, errors):
+    if _is(rules, str):
+        with open(rules) as fd:
+            for r in stream_rules(fd, workers, chunksize, cfg, errors):
+                yield r
+        return
+    items = enumerate(rules, 1)
+    if workers:
+        from concurrent.futures import ProcessPoolExecutor
+
+        tcfg = dict([(k, cfg[k]) for k in ('brkts', 'sep') if k in cfg])
+        ex = ProcessPoolExecutor(workers)
+        f = partial(parse_rules, tokenize=tcfg)
+        res = pool_map(ex, f, items, chunksize, 2 * workers)
+    else:
+        res = parse_rules(items)
+    for nr, name, cond, err in res:
+        if err is not None:
+            errors.append((name if name is not None else nr, err))
+        elif name is not None:
+            yield name, cond
+
+
+def parse_rules(items, tokenize=None):
+    """[(line nr, name, cond, error), ...] for (line nr, rule) items"""
+    r = []
+    for nr, rule in items:
+        name = None
+        try:
+            if _is(rule, str):
+                if not rule.strip():
+                    continue
+                rule = json.loads(rule)
+            if _is(rule, dict):
+                name, cond = (rule['name'], rule['cond']) if 'cond' in rule else (
+                    list(rule.items())[0] if len(rule) == 1 else (None, None)
+                )
+            elif _is(rule, list) and len(rule) == 2:
+                name, cond = rule
+            if name is None:
+                raise Exception('Not a named condition: %s' % str(rule))
+            if tokenize is not None and _is(cond, str) and not cond.startswith('deep:'):
+                cond = deserialize_str(cond, **tokenize)[0]
+            r.append((nr, name, cond, None))
+        except Exception as ex:
+            r.append((nr, name, None, ex))
+    return r
+
+
+def save_bundle(fn, conds, **cfg):
+    """
+    Builds conds via qualify(conds, **cfg) and saves a bundle into file fn, for fast
+    builds via load_bundle: conds, their tokenized structures and the code objects of
+    the compiled functions (marshalled).
+
+    Bundles use the compile backend (compile=True), unless given otherwise or with
+    options of the partial chain (CHAIN_OPTS). Compared to qualify(conds, compile=True)
+    load_bundle skips tokenizing and compiling, the condition trees are still built.
+    W/o compile only the tokenizing is skipped.
+
+    Returns the qualifier.
+    """
+    cfg.setdefault('compile', not any([cfg.get(k) for k in CHAIN_OPTS]))
+    sc, cc = {}, {}
+    q = qualify(copy.deepcopy(conds), struct_cache=sc, code_cache=cc, **cfg)
+    b = {'fingerprint': bundle_fingerprint(cfg), 'conds': conds, 'structs': sc, 'codes': cc}
+    with open(fn, 'wb') as fd:
+        fd.write(marshal.dumps(b))
+    return q
+
+
+def load_bundle(fn, **cfg):
+    """
+    Returns qualify(<conds of bundle>, **cfg), built from the bundle saved by
+    save_bundle(fn, conds, **cfg).
+
+    When the bundle is outdated (other pycond module, python, OPS, lookup providers
+    or cfg) conds are built from scratch and the bundle is saved again.
+    """
+    cfg.setdefault('compile', not any([cfg.get(k) for k in CHAIN_OPTS]))
+    with open(fn, 'rb') as fd:
+        b = marshal.loads(fd.read())
+    if b['fingerprint'] != bundle_fingerprint(cfg):
+        return save_bundle(fn, b['conds'], **cfg)
+    return qualify(b['conds'], struct_cache=b['structs'], code_cache=b['codes'], **cfg)
+
+
+def bundle_fingerprint(cfg):
+    h = hashlib.sha256()
+    with open(__file__.rsplit('.', 1)[0] + '.py', 'rb') as fd:
+        h.update(fd.read())
+    h.update(sys.version.encode())
+
+    def add(*s):
+        h.update(repr(s).encode())
+
+    def add_func(f):
+        f = getattr(f, 'func', f)  # partials
+        c = getattr(f, '__code__', None)
+        add(getattr(f, '__module__', 0), getattr(f, '__qualname__', type(f).__name__))
+        if c:
+            add_code(c)
+
+    def add_code(c):
+        # no reprs of code objects, those contain their address:
+        h.update(c.co_code)
+        add(c.co_names)
+        for k in c.co_consts:
+            if inspect.iscode(k):
+                add_code(k)
+            elif _is(k, frozenset):  # order differs per process (hash seeds)
+                add(sorted([repr(i) for i in k]))
+            else:
+                add(k)
+
+    def add_ns(ns, depth=0):
+        items = ns.items() if _is(ns, dict) else [(k, getattr(ns, k)) for k in dir(ns)]
+        for k, v in sorted(items, key=lambda kv: str(kv[0])):
+            if str(k).startswith('__'):
+                continue
+            add(k)
+            if _is(v, dict) and 'func' in v:
+                v = v['func']
+            if _is(v, (dict, type)) and depth < 5:
+                add_ns(v, depth + 1)
+            elif callable(v):
+                add_func(v)
+
+    for ops in OPS, COMB_OPS:
+        for k in sorted(ops):
+            add(k)
+            add_func(ops[k])
+    for k, v in sorted(cfg.items()):
+        add(k)
+        if k in ('lookup_provider', 'lookup_provider_dict'):
+            add_ns(v)
+        elif callable(v):
+            add_func(v)
+        elif _is(v, (str, int, float, bool, type(None), tuple, list)):
+            add(v)
+    return h.hexdigest()
+
+
+worker_qualifier = [None]
+
+
+def qualify_worker_init(conds, cfg):
+    worker_qualifier[0] = qualify(conds, **cfg)
+
+
+def qualify_worker_run(chunk):
+    return worker_qualifier[0].many(chunk)
+
+
 # ---------------------------------------------------------------------------------  rx
 
 
@@ -1248,6 +3242,196 @@ class Completed(Exception):
     """
 
 
+class AsyncLane:
+    """
+    Where rxop runs the items which need async lookups (see Async):
+
+    kind: 'gevent' (default), 'threads' (ThreadPoolExecutor) or 'asyncio' (the
+    default executor of loop, by default of a new one, running in a daemon thread).
+    Note: 'asyncio' is a thread lane as well, the items are run (blocking) in the
+    loop's executor threads, not as coroutines.
+
+    With a limit spawn blocks while limit items are in flight, i.e. backpressure
+    towards the source. stats() has the gauges.
+
+    Exceptions of the spawned functions are counted (errors gauge) and passed to
+    err_handler(exc), by default reported via sys.excepthook - not lost in the
+    executor futures.
+    """
+
+    def __init__(self, kind='gevent', limit=None, loop=None, err_handler=None):
+        self.kind, self.limit = kind, limit
+        self.in_flight = self.queued = self.done = self.errors = 0
+        self.err_handler = err_handler or self.report
+        self.lock = threading.Lock()
+        if kind == 'gevent':
+            import gevent
+            from gevent.lock import BoundedSemaphore
+
+            self.sem = BoundedSemaphore(limit) if limit else None
+            self.submit = gevent.spawn
+            return
+        self.sem = threading.BoundedSemaphore(limit) if limit else None
+        if kind == 'threads':
+            self.submit = ThreadPoolExecutor(limit, thread_name_prefix='pycond').submit
+        elif kind == 'asyncio':
+            if loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True).start()
+            self.loop = loop
+            self.submit = partial(self.loop_submit, loop)
+        else:
+            raise ValueError('Unknown async lane: %s' % kind)
+
+    def semaphore(self, n):
+        """A semaphore blocking the way the lane runs its items (greenlets or threads)"""
+        if self.kind == 'gevent':
+            from gevent.lock import Semaphore
+
+            return Semaphore(n)
+        return threading.Semaphore(n)
+
+    @staticmethod
+    def loop_submit(loop, f, *a):
+        loop.call_soon_threadsafe(partial(loop.run_in_executor, None, f, *a))
+
+    def spawn(self, f, *a):
+        if self.sem:
+            with self.lock:
+                self.queued += 1
+            self.sem.acquire()
+            with self.lock:
+                self.queued -= 1
+        with self.lock:
+            self.in_flight += 1
+        self.submit(self.run, f, a)
+
+    @staticmethod
+    def report(exc):
+        sys.excepthook(type(exc), exc, exc.__traceback__)
+
+    def run(self, f, a):
+        try:
+            f(*a)
+        except Exception as ex:
+            with self.lock:
+                self.errors += 1
+            self.err_handler(ex)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.done += 1
+            if self.sem:
+                self.sem.release()
+
+    def stats(self):
+        return {
+            'kind': self.kind,
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'done': self.done,
+            'errors': self.errors,
+        }
+
+
+class RxSlot:
+    """An item in the reorder buffer, observer for run_item"""
+
+    __slots__ = ('x', 'passed', 'done', 'completes')
+
+    def __init__(self, x):
+        self.x, self.passed, self.done, self.completes = x, False, False, False
+
+    def on_next(self, x):
+        self.passed = True
+
+    def on_completed(self):
+        self.completes = True
+
+
+class RxReorder:
+    """
+    rxop(ordered=True): Emits the items in input order, completed ones are held until
+    all items before them are done.
+
+    maxsize: max items in the buffer, then add blocks (backpressure towards the source).
+             Blocking on a semaphore of the lane (see AsyncLane.semaphore), so that
+             with gevent the greenlets draining the buffer can run meanwhile.
+    timeout: max seconds an async item may take, then by policy
+             'skip': It is dropped (and err_handler called with a TimeoutError)
+             'error': The stream errors with a TimeoutError
+    """
+
+    def __init__(self, obs, maxsize, timeout, policy, on_timeout, scheduler, lane=None):
+        self.obs, self.maxsize = obs, maxsize
+        self.timeout, self.policy, self.on_timeout = timeout, policy, on_timeout
+        self.scheduler = scheduler
+        self.slots, self.closing = deque(), False
+        self.lock = threading.RLock()
+        self.free = lane.semaphore(maxsize) if lane else threading.Semaphore(maxsize)
+
+    def add(self, x):
+        self.free.acquire()
+        with self.lock:
+            slot = RxSlot(x)
+            self.slots.append(slot)
+            return slot
+
+    def run_async(self, run_item, slot, x, asyn_kw):
+        if self.timeout:
+            self.scheduler.schedule_relative(self.timeout, lambda *a: self.expire(slot))
+        try:
+            run_item(slot, x, asyn_kw)
+        finally:
+            self.set_done(slot)
+
+    def set_done(self, slot):
+        with self.lock:
+            if slot.done:
+                return  # expired before
+            slot.done = True
+            self.flush()
+
+    def expire(self, slot):
+        with self.lock:
+            if slot.done:
+                return
+            slot.done, slot.passed = True, False
+            ex = TimeoutError('Async item timed out after %ss' % self.timeout)
+            if self.policy == 'error':
+                self.clear()
+                self.obs.on_error(ex)
+                return
+            if self.on_timeout:
+                self.on_timeout(slot.x, ex)
+            self.flush()
+
+    def close(self):
+        with self.lock:
+            self.closing = True
+            self.flush()
+
+    def clear(self):
+        for i in range(len(self.slots)):
+            self.free.release()
+        self.slots.clear()
+
+    def flush(self):
+        slots, obs = self.slots, self.obs
+        while slots and slots[0].done:
+            slot = slots.popleft()
+            self.free.release()
+            if slot.passed:
+                obs.on_next(slot.x)
+            if slot.completes:
+                self.clear()
+                self.closing = True
+        if self.closing and not slots:
+            self.closing = None  # once
+            obs.on_completed()
+
+
 def import_rx(*incl):
     """helper for clients, to normalize rx namespace"""
     from rx import operators as rx
@@ -1262,6 +3446,13 @@ def import_rx(*incl):
     return r
 
 
+def run_guarded(f, x):
+    try:
+        return f(x)
+    except Exception as ex:
+        return ex
+
+
 def rxop(cond, qualifier=None, **cfg):
     """
     Returns a reactive-x operator ror streaming data (optional)
@@ -1273,7 +3464,7 @@ def rxop(cond, qualifier=None, **cfg):
 
     It does support to dispatch blocking functions asyncronously, depending if conditions are met - then giving up order.
 
-    Only async platform supported currently: gevent (hardcoded herein)
+    Async platforms: gevent (default), threads, asyncio - see Async Lanes
 
     == Usage:
 
@@ -1290,6 +3481,29 @@ def rxop(cond, qualifier=None, **cfg):
     Rationale: Async ops are done with libs, which ship with their own timeout params, no need to re-invent / overlay with ours.
     => users should except at such timeouts, which will trigger the cfg['err_handler'] function - where further arrangements can be done.
 
+    == Async Lanes:
+
+    lane='gevent' (default) | 'threads' | 'asyncio' | an AsyncLane instance,
+    lane_limit=<max items in flight>. The operator function has the lane as .lane,
+    with the gauges in .lane.stats(). Errors not handled in the items (e.g. raised
+    by downstream observers) go to the err_handler of the lane.
+
+    == Order:
+
+    ordered=True: Items are emitted in input order, also when some went async, via a
+    reorder buffer (reorder_max items, default 1000, then blocking the source).
+    reorder_timeout=<secs>: Max time for async items, then reorder_policy
+    'skip' (default, err_handler is called with a TimeoutError) or 'error'.
+    The stream completes after all items are done.
+
+    == Batching:
+
+    batch=<count>: Items are buffered (max count or batch_time seconds, default 0.005),
+    each batch is run in one qualifier.many call and the passing items are emitted as list,
+    with flatten=True one by one. Async results are emitted as one item lists.
+    W/o partial chain options (CHAIN_OPTS, e.g. asyn) the conditions are compiled
+    (compile=True).
+
     == Perf:
 
     See test_rx_perf.py regarding perf
@@ -1305,13 +3519,22 @@ def rxop(cond, qualifier=None, **cfg):
 
     """
     Rx, rx = import_rx()
+    batch = cfg.pop('batch', None)
+    batch_time, flatten = cfg.pop('batch_time', 0.005), cfg.pop('flatten', False)
+    if batch and not qualifier:
+        # batches are about throughput:
+        cfg.setdefault('compile', not any([cfg.get(k) for k in CHAIN_OPTS]))
     qualifier, is_single = qualifier or qualify(cond, get_type=True, **cfg)
 
+    lane, limit = cfg.pop('lane', None), cfg.pop('lane_limit', None)
+    ordered, reorder_max = cfg.pop('ordered', False), cfg.pop('reorder_max', 1000)
+    reorder_to, reorder_pol = cfg.pop('reorder_timeout', None), cfg.pop('reorder_policy', 'skip')
     asyn = cfg.get('asyn')
     if asyn:
-        import gevent
+        if not _is(lane, AsyncLane):
+            lane = AsyncLane(lane or 'gevent', limit=limit)
 
-    elif is_single:
+    elif is_single and not batch:
 
         def f(qualifier, x):
             return bool(qualifier(x))
@@ -1361,11 +3584,103 @@ def rxop(cond, qualifier=None, **cfg):
                 # Why: The low level method is over an order of magn. faster faster than a flat_map(map(just(x, GS))) :-/
                 # !! Please test perf FIRST before trying to build this with rx !!
                 # Note: By handing the subj and not the observer, the stream never completes - deemed better than early completions with spawned async tasks around:
-                gevent.spawn(run_item, subj_async_results, x, res)
+                lane.spawn(run_item, subj_async_results, x, res)
 
             return source.subscribe(on_next, obs.on_error, obs.on_completed, scheduler)
 
         return Rx.merge(Rx.create(subscribe), subj_async_results)
 
-    return _run
-    return _run
+    def on_timeout(x, exc):
+        eh = cfg.get('err_handler')
+        eh(x, cfg=cfg, ctx=kw, exc=exc) if eh else None
+
+    def _run_ordered(source):
+        """custom operator, in order"""
+
+        def subscribe(obs, scheduler=None):
+            sched = cfg.get('scheduler') or scheduler or Rx.scheduler.TimeoutScheduler()
+            ro = RxReorder(obs, reorder_max, reorder_to, reorder_pol, on_timeout, sched, lane)
+
+            def on_next(x, run_item=run_item):
+                slot = ro.add(x)
+                res = run_item(slot, x, None)
+                if not res:
+                    return ro.set_done(slot)
+                lane.spawn(ro.run_async, run_item, slot, x, res)
+
+            return source.subscribe(on_next, obs.on_error, ro.close, scheduler)
+
+        return Rx.create(subscribe)
+
+    many = getattr(qualifier, 'many', None)
+
+    def run_batch(obs, xs, qualifier=qualifier, cfg=cfg):
+        """run_item for a batch: one qualifier.many call, exceptions handled per item"""
+        res, completed = [], False
+        if many:
+            rs = many(xs, errors=True)
+        else:
+            rs = [run_guarded(qualifier, x) for x in xs]
+        for x, r in zip(xs, rs):
+            if not _is(r, Exception):
+                if r:
+                    res.append(x)
+            elif _is(r, Async):
+                lane.spawn(run_item, subj_async_results, x, r.args[0][0])
+            elif _is(r, Completed):
+                completed = True
+                break
+            else:
+                eh = cfg.get('err_handler')
+                eh(x, cfg=cfg, ctx=kw, exc=r) if eh else None
+        if res:
+            if flatten:
+                for x in res:
+                    obs.on_next(x)
+            else:
+                obs.on_next(res)
+        if completed:
+            obs.on_completed()
+
+    def _run_batched(source):
+        """custom operator, per batch (rx.buffer_with_time_or_count is 4 times slower)"""
+
+        def subscribe(obs, scheduler=None):
+            cur, lock = [[]], threading.Lock()
+            sched = cfg.get('scheduler') or scheduler or Rx.scheduler.TimeoutScheduler()
+
+            def on_next(x):
+                with lock:
+                    xs = cur[0]
+                    xs.append(x)
+                    if len(xs) == 1 and batch_time:
+                        sched.schedule_relative(batch_time, partial(on_time, xs))
+                    if len(xs) < batch:
+                        return
+                    cur[0] = []
+                    run_batch(obs, xs)
+
+            def on_time(xs, *a):
+                with lock:
+                    if cur[0] is xs:
+                        cur[0] = []
+                        run_batch(obs, xs)
+
+            def on_completed():
+                with lock:
+                    xs = cur[0]
+                    cur[0] = []
+                    if xs:
+                        run_batch(obs, xs)
+                    obs.on_completed()
+
+            return source.subscribe(on_next, obs.on_error, on_completed, scheduler)
+
+        async_res = subj_async_results
+        if not flatten:
+            async_res = async_res.pipe(rx.map(lambda x: [x]))
+        return Rx.merge(Rx.create(subscribe), async_res)
+
+    op = _run_batched if batch else _run_ordered if ordered else _run
+    op.lane = lane
+    return op
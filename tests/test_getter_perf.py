@@ -1,5 +1,6 @@
 import time
-from pycond import parse_cond
+from functools import partial
+from pycond import parse_cond, Getters, GetterCache, qualify
 
 _is = isinstance
 
@@ -28,12 +29,132 @@ def test_comp_perf():
             assert pc(state=S)
         return now() - t0
 
-    dt1 = run(deep='.')
+    # the generic get_deep, splitting and probing per evaluation:
+    dt1 = run(lookup=Getters.state_get_deep)
     dt2 = run(deep2='.')
     dt3 = run(deep3='.')
+    dt4 = run(deep='.')  # getter built per atom
     print('Cached item getter perf vs get_deep:', dt1 / dt2)
     print('Eval perf vs get_deep:', dt1 / dt3)
+    print('Built getter perf vs get_deep:', dt1 / dt4)
     assert 2 * dt2 < dt1
+    assert 2 * dt4 < dt1
+
+
+def test_deep2_heterogeneous_stream():
+    """different item shapes for the same key are learned, not failing"""
+
+    class o:
+        b = [1, 2]
+
+    items = [{'a': {'b': [1, 2]}}, {'a': o}, {'a': {'b': (1, 2)}}, {'a': [{'b': 1}]}]
+    pc = parse_cond('a.b.1 eq 2', deep2='.')[0]
+    for i in range(3):
+        assert [pc(state=s) for s in items] == [True, True, True, False]
+    c = GetterCache()
+    g = partial(Getters.get_deep2, 'a.b.1', 0, {}, _c=c)
+    assert [g(state=s)[0] for s in items * 2] == [2, 2, 2, None] * 2
+    assert len(c['a.b.1']) == 3
+
+
+def test_getter_cache_bounded_and_scoped():
+    c = GetterCache(maxsize=2)
+    g = partial(Getters.get_deep2, _c=c)
+    s = {'a': {'b': 1, 'c': 2, 'd': 3}}
+    for i in range(2):
+        for k in 'a.b', 'a.c', 'a.d':
+            assert g(k, 0, {}, s)[0] == s['a'][k[-1]]
+    st = c.stats()
+    assert (st['size'], st['evictions'], st['hits'], st['misses']) == (2, 4, 0, 6)
+    assert g('a.d', 0, {}, s)[0] == 3
+    assert (c.stats()['hits'], c.stats()['misses']) == (1, 6)
+
+    # other shape, no getter matching: a miss
+    class d:
+        d = 4
+
+    assert g('a.d', 0, {}, {'a': d})[0] == 4
+    assert (c.stats()['hits'], c.stats()['misses']) == (1, 7)
+    assert g('a.d', 0, {}, {'a': d})[0] == 4
+    assert (c.stats()['hits'], c.stats()['misses']) == (2, 7)
+
+    # scoped per qualifier:
+    class o:
+        b = 1
+
+    q = qualify({'x': 'a.b eq 1', 'y': 'a.b gt 0'}, deep2='.', getter_cache=True)
+    assert q({'a': o}) == {'x': True, 'y': True}
+    gc = q.args[0].keywords['getter_cache']
+    assert gc is not Getters._get_deep2_cache
+    # the atoms have their getters built (also for attributes), no cache probes:
+    assert gc.stats()['size'] == 0
+
+
+def test_getter_cache_eviction_cost():
+    """inserting into the full cache costs about the same as into an empty one"""
+    n = 50000
+    c = GetterCache(maxsize=n)
+    t0 = now()
+    for i in range(n):
+        c[i] = i
+    dt_fill = now() - t0
+    t0 = now()
+    for i in range(n, 2 * n):
+        c[i] = i
+    dt_evict = now() - t0
+    print('evicting vs filling inserts:', dt_evict / dt_fill)
+    assert c.stats()['evictions'] == n and len(c) == n and next(iter(c)) == n
+    assert dt_evict < 4 * dt_fill
+
+
+def test_build_scales_linear():
+    """dependency graph of the named conditions: linear in the number of rules"""
+
+    def conds(n):
+        c = {'r%s' % i: 'a eq %s and [b gt 2 or c]' % i for i in range(n)}
+        c['x'] = ':r1 and :r2'
+        return c
+
+    def build(n):
+        t0 = now()
+        q = qualify(conds(n))
+        return now() - t0, q
+
+    dt1, dt4 = min([build(1000)[0] for i in range(2)]), min([build(4000)[0] for i in range(2)])
+    print('build 4000 vs 1000 rules:', dt4 / dt1)
+    assert dt4 < 10 * dt1  # quadratic: 16
+    q, dt = build(4000)[1], []
+    for i in range(3):
+        t0 = now()
+        q.replace('r5', 'a eq %s and :x' % i)
+        dt.append(now() - t0)
+    print('replace vs build:', min(dt) / dt4)
+    assert min(dt) < dt4 / 10
+
+
+def test_many_perf():
+    """the batch APIs amortize the per item setup"""
+    import timeit
+    from pycond import pycond, evaluate_many
+
+    def ratio(each, many):
+        # best of, alternating, against load changes:
+        t = [[], []]
+        for i in range(11):
+            t[0].append(timeit.timeit(each, number=1))
+            t[1].append(timeit.timeit(many, number=1))
+        return min(t[1]) / min(t[0])
+
+    items = [{'a': i % 5, 'b': i} for i in range(5000)]
+    f = pycond('a eq 1 and b gt 2')
+    r = ratio(lambda: [f(state=x) for x in items], lambda: evaluate_many('a eq 1 and b gt 2', items))
+    print('evaluate_many vs per item:', r)
+    assert r < 0.8
+
+    q = qualify({'r': 'a eq 1 and b gt 2'})  # the per item setup, relative to one rule
+    r = ratio(lambda: [q(x) for x in items], lambda: q.many(items))
+    print('qualify(...).many vs per item:', r)
+    assert r < 0.9
 
 
 if __name__ == '__main__':
@@ -5,9 +5,11 @@ from pycond import run_all_ops_thru
 from pycond import parse_cond, State as S
 from pycond import pycond, state_get, dbg_get, OPS, COMB_OPS
 import unittest
+import re
 import sys
 import os
 import operator
+from collections import OrderedDict
 import time
 
 d = os.path.dirname
@@ -542,6 +544,30 @@ class TokenizerToStruct(T):
         f = pc.parse_cond(c)
         assert f[0](state=s) == True
 
+    def test_tokenize_positions(s):
+        pos = []
+        c = '[a eq "x y"] and not b'
+        eq(s, pc.tokenize(c, positions=pos), ['[', 'a', 'eq', 'str:x y', ']', 'and_not', 'b'])
+        eq(s, pos, [0, 1, 3, 6, 11, 13, 21])
+
+    def test_bracket_errors(s):
+        for c, msg in (
+            ('[a eq 1 and [b eq 2]', 'Unclosed bracket at position 0'),
+            ('a eq 1] or b', 'Unbalanced closing bracket at position 6'),
+            ('a eq 1 \\', 'Nothing to escape at position 7'),
+        ):
+            try:
+                pc.parse_cond(c)
+                raise Exception('Expected error')
+            except pc.ParseError as ex:
+                eq(s, str(ex), msg)
+
+    def test_long_or_chain(s):
+        c = ' or '.join(['[id eq %s]' % i for i in range(3000)])
+        struct = pc.parse_cond(c, get_struct=True)[0]
+        eq(s, len(struct), 5999)
+        eq(s, struct[-1], ['id', 'eq', '2999'])
+
 
 class StructConditions(T):
     def xtest_no_list_eval(s):
@@ -604,6 +630,676 @@ class StructConditions(T):
         res = c(state={'foo': {'peer': p}})
         assert res == True  # second condition, after or, now matches
 
+    def test_deep_getter_built_per_atom(self):
+        for m in 'deep', 'deep2', 'deep3':
+            f, nfo = pc.parse_cond('a.b.1.c eq 42', **{m: '.'})
+            g = nfo['tree']['lookup']
+            assert g.__name__ == 'deep_get'
+            assert g(state={'a': {'b': [0, {'c': 42}]}}) == (42, 42)
+            assert f(state={'a': {'b': [0, {'c': 42}]}}) == True
+            assert f(state={'a': {'b': {'1': {'c': 42}}}}) == True  # dict w/ str key
+            assert f(state={'a': {'b': [0]}}) == False
+            assert f(state={'a': {'b': (0, {'c': 42})}}) == True  # tuple
+
+            class o:
+                b = [0, OrderedDict(c=42)]  # attribute, dict subclass
+
+            assert f(state={'a': o}) == True
+            assert f(state={'a': {'b': 'x{'}}) == False  # generic step
+            assert f(state={}) == False
+
+
+class Compile(T):
+    conds = (
+        'foo',
+        'not foo',
+        'foo eq bar and baz gt 1',
+        'foo eq bar or baz not gt 1 and k',
+        '[foo or baz] and_not k',
+        'foo xor baz',
+        'foo or_not baz',
+        'foo rev contains barx',
+        [['baz', 'in', [1, 2]], 'or', ['baz', 'rev', 'not', 'lt', 3]],
+        [False, 'or', ['foo', 'and', True]],
+    )
+    states = (
+        {'foo': '', 'baz': 0},
+        {'foo': 'bar', 'baz': 2, 'k': 1},
+        {'foo': 'x', 'baz': 1, 'k': ''},
+        {'foo': 'bar', 'baz': 3, 'k': 0},
+        {'foo': '', 'baz': 0, 'k': 'x'},
+    )
+
+    def test_same_results_than_partials(s):
+        for cond in s.conds:
+            f = pycond(cond)
+            fc, m = parse(cond, compile=True)
+            assert 'def pycond_compiled' in m['source']
+            for state in s.states:
+                for kw in {}, {'autoconv_lookups': True}:
+                    eq(s, fc(state=state), f(state=state))
+                    eq(s, pycond(cond, compile=True, **kw)(state=state), f(state=state))
+
+    def test_inlined(s):
+        f, m = parse('foo eq bar and baz', compile=True)
+        assert "state.get('foo') ==" in m['source']
+        S['foo'] = 'bar'
+        S['baz'] = 1
+        eq(s, f(), True)
+        S['baz'] = 0
+        eq(s, f(), False)
+
+    def test_custom_lookup_prefix_and_hook(s):
+        def my_lu(k, v):
+            return len(k), v
+
+        eq(s, pycond('len4 eq 4', lookup=my_lu, compile=True)(), True)
+        f = pycond('a eq 1', prefix='p', compile=True)
+        eq(s, f(state={'p': {'a': 1}}), True)
+        eq(s, pycond('a eq 2', ops_thru=lambda f_op, a, b: True, compile=True)(), True)
+
+    def test_long_chain(s):
+        cond = ' or '.join(['id eq %s' % i for i in range(500)])
+        f = pycond(cond, compile=True)
+        eq(s, f(state={'id': 499}), True)
+        eq(s, f(state={'id': 500}), False)
+
+
+class Batch(T):
+    states = [{'a': {'b': i}, 'i': i} for i in range(10)]
+
+    def test_evaluate_many(s):
+        res = pc.evaluate_many('i gt 6', s.states)
+        eq(s, res, [False] * 7 + [True] * 3)
+        eq(s, pc.evaluate_many('a.b lt 2', s.states, indices=True, deep='.'), [0, 1])
+        f = pycond('i mod 2')
+        eq(s, pc.evaluate_many(f, s.states, indices=True), [1, 3, 5, 7, 9])
+
+    def test_qualify_many(s):
+        q = pc.qualify({'odd': 'i mod 2', 'big': 'i gt 7'})
+        res = q.many(s.states)
+        eq(s, res, [q(x) for x in s.states])
+        eq(s, res[9], {'odd': True, 'big': True})
+        eq(s, q.many(s.states, indices=True), [1, 3, 5, 7, 8, 9])
+
+
+class Index(T):
+    def test_index(s):
+        conds = {
+            'order': 'type eq order and amount gt 10',
+            'refund': '[type eq refund] and_not amount gt 100',
+            'big': 'amount gt 1000',
+            'typed': [['type', 'in', ['order', 'refund']], 'and', 'amount'],
+            'any': 'type eq order or type eq refund',
+        }
+        plain = pc.qualify(conds)
+        q = pc.qualify(conds, index=True)
+        for x in (
+            {'type': 'order', 'amount': 20},
+            {'type': 'refund', 'amount': 2000},
+            {'type': 'other', 'amount': 2000},
+            {'type': ['unhashable'], 'amount': 2},
+            {'amount': 0},
+        ):
+            eq(s, q(x), plain(x))
+            eq(s, list(q(x)), list(plain(x)))
+        # only candidates evaluated, the others known False:
+        x = {'type': 'other', 'amount': 2000}
+        r = {'order': False, 'refund': False, 'big': True, 'typed': False, 'any': False}
+        eq(s, q(x), r)
+        # same shape also with match_any=False:
+        for x in ({'type': 'refund', 'amount': 2000}, {'type': 'other', 'amount': 0}):
+            plain = pc.qualify(conds, match_any=False)
+            eq(s, pc.qualify(conds, index=True, match_any=False)(x), plain(x))
+
+    def test_no_index_for_root(s):
+        q = pc.qualify({'root': 'a eq 1', 'b': 'b eq 2'}, index=True)
+        eq(s, q({'a': 1}), {'root': True})
+
+
+class CSE(T):
+    def test_shared_atoms_evaluated_once(s):
+        looked = []
+
+        def hk(f_op, a, b):
+            looked.append(b)
+            return f_op(a, b)
+
+        conds = dict(
+            [('r%s' % i, [['tenant', 'eq', 'acme'], 'and', ['i', 'gt', i]]) for i in range(5)]
+        )
+        conds['other'] = 'tenant eq acme and [i gt 1 or i lt 0]'
+        x = {'tenant': 'acme', 'i': 3}
+        res = pc.qualify(conds, ops_thru=hk)(x)
+        eq(s, looked.count('acme'), 6)
+        del looked[:]
+        q = pc.qualify(conds, ops_thru=hk, cse=True)
+        eq(s, q(x), res)
+        eq(s, looked.count('acme'), 1)
+        eq(s, looked.count(1), 1)  # i gt 1 shared as well
+        # next item, evaluated again:
+        eq(s, q({'tenant': 'x'})['other'], False)
+        eq(s, looked.count('acme'), 2)
+
+    def test_memo_not_in_cached_output(s):
+        q = pc.qualify({'a': 'k eq 1', 'b': 'k eq 1'}, cse=True, add_cached=True)
+        eq(s, q({'k': 1}), {'a': True, 'b': True})
+
+
+class BuildCache(T):
+    def test_build_cache(s):
+        c = pc.BuildCache(maxsize=2)
+        f, m = parse_cond('a eq 1', cache=c)
+        eq(s, parse_cond('a eq 1', cache=c)[0] is f, True)
+        # other cfg, other build:
+        f2 = pycond('a eq 1', cache=c, autoconv=False)
+        assert f2 is not f
+        eq(s, f2(state={'a': '1'}), True)
+        eq(s, f(state={'a': 1}), True)
+        pycond('a eq 2', cache=c)  # evicts the first one
+        st = c.stats()
+        eq(s, (st['hits'], st['misses'], st['size']), (1, 3, 2))
+        assert pycond('a eq 1', cache=c) is not f
+        c.clear()
+        eq(s, c.stats()['size'], 0)
+
+    def test_invalidated_on_ops_change(s):
+        pycond('a eq 1', cache=True)
+        assert pc.build_cache.stats()['size'] > 0
+        pc.ops_use_symbolic_and_txt(allow_single_eq=True)
+        eq(s, pc.build_cache.stats()['size'], 0)
+        eq(s, pycond('a = 1', cache=True)(state={'a': 1}), True)
+        pc.ops_reset()
+
+
+class Adaptive(T):
+    def cnt(s, cond, **kw):
+        looked = []
+
+        def hk(f_op, a, b):
+            looked.append(b)
+            return f_op(a, b)
+
+        return looked, pycond(cond, ops_thru=hk, **kw)
+
+    def test_selective_branch_moved_first(s):
+        looked, f = s.cnt('a eq 1 and b eq 1 and c eq 1', adaptive=100)
+        for i in range(200):
+            eq(s, f(state={'a': 1, 'b': 1, 'c': i + 2}), False)
+        del looked[:]
+        eq(s, f(state={'a': 1, 'b': 1, 'c': 0}), False)
+        eq(s, looked, [1])  # only c eq 1 evaluated
+        eq(s, f(state={'a': 1, 'b': 1, 'c': 1}), True)
+
+    def test_or_chain_and_nesting(s):
+        looked, f = s.cnt('a eq 1 or [b eq 1 and c eq 2] or d eq 3', adaptive=50)
+        for i in range(100):
+            eq(s, f(state={'a': 0, 'b': 0, 'c': 0, 'd': 3}), True)
+        del looked[:]
+        f(state={'a': 0, 'd': 3})
+        eq(s, looked, [3])
+        eq(s, f(state={'a': 0, 'b': 1, 'c': 2, 'd': 0}), True)
+        eq(s, f(state={'a': 0, 'b': 1, 'c': 0, 'd': 0}), False)
+
+    def test_pinned_provider_keeps_position(s):
+        calls = []
+
+        class F:
+            def notify(k, v, cfg, data, **kw):
+                calls.append(data['a'])
+                return True, 0
+
+        cond = 'a eq 1 and :notify and b eq 1'
+        f = pycond(cond, lookup_provider=F, adaptive=20, adaptive_pin=['notify'])
+        for i in range(100):
+            f(state={'a': i % 2, 'b': 0})
+        # notify only ever called after a eq 1 passed:
+        eq(s, set(calls), {1})
+
+
+class Instrument(T):
+    def test_counts(s):
+        f, nfo = parse_cond('a eq 1 and [b gt 2 or c]', instrument=True)
+        for st in {'a': 1, 'b': 3}, {'a': 0}, {'a': 1, 'b': 0, 'c': 1}:
+            f(state=st)
+        r = nfo['stats'].report()
+        evals = lambda k: (r[k]['evals'], r[k]['trues'], r[k]['skips'])
+        eq(s, evals('a eq 1'), (3, 2, 0))
+        eq(s, evals('b gt 2 or c'), (2, 2, 1))  # skipped once, a was false
+        eq(s, evals('b gt 2'), (2, 1, 1))  # dito
+        eq(s, evals('c'), (1, 1, 2))  # when a was false and when b was true
+        eq(s, sum(r['a eq 1']['hist']), 3)
+        assert r['a eq 1']['time'] >= r['a eq 1']['t_lookup']
+        # same text on both sides:
+        f, nfo = parse_cond('a and [b and a]', instrument=True)
+        f(state={'a': 0})
+        r = nfo['stats'].report()
+        eq(s, (r['a']['evals'], r['a']['skips'], r['b']['skips']), (1, 1, 1))
+
+    def test_off_is_uninstrumented(s):
+        f, nfo = parse_cond('a eq 1')
+        eq(s, f.func, pc.f_atomic)
+        assert 'stats' not in nfo
+
+    def test_qualify_shared_stats(s):
+        q = pc.qualify({'x': 'a eq 1', 'y': 'a eq 1 or b eq 1'}, instrument=True)
+        q({'a': 1})
+        eq(s, q.stats.report()['a eq 1']['evals'], 2)
+
+    def test_no_silent_mode_combinations(s):
+        for kw in (
+            {'cse': True, 'instrument': True},
+            {'instrument': True, 'adaptive': True},
+            {'instrument': True, 'compile': True},
+            {'adaptive': True, 'aio': True},
+        ):
+            s.assertRaises(ValueError, pc.qualify, {'x': 'a eq 1'}, **kw)
+        s.assertRaises(ValueError, parse_cond, 'a eq 1', instrument=True, compile=True)
+        # batch APIs don't compile then:
+        eq(s, pc.evaluate_many('a eq 1', [{'a': 1}], instrument=True), [True])
+
+
+class AIO(T):
+    def providers(s, calls):
+        import asyncio
+
+        class F:
+            async def slow(k, v, cfg, data, **kw):
+                calls.append('slow')
+                await asyncio.sleep(0.2)
+                return data['s'], v
+
+            async def fast(k, v, cfg, data, **kw):
+                calls.append('fast')
+                await asyncio.sleep(0.01)
+                return data['f'], v
+
+            def sync(k, v, cfg, data, **kw):
+                return data['y'], v
+
+        return F
+
+    def test_concurrent_and_lazy(s):
+        import asyncio
+
+        calls = []
+        F = s.providers(calls)
+        f = pycond(':slow eq 1 and :fast eq 1 and a eq 1', lookup_provider=F, aio=True)
+
+        async def main():
+            t0 = time.time()
+            eq(s, await f(state={'s': 1, 'f': 1, 'a': 1}), True)
+            assert time.time() - t0 < 0.3  # not 0.21 + 0.01 sequentially but concurrent
+            t0 = time.time()
+            eq(s, await f(state={'s': 1, 'f': 0, 'a': 1}), False)
+            assert time.time() - t0 < 0.1  # slow one cancelled
+            del calls[:]
+            # sync branch decides, no provider called:
+            eq(s, await f(state={'s': 1, 'f': 1, 'a': 0}), False)
+            eq(s, calls, [])
+            g = pycond(':sync eq 1 or not :fast eq 1', lookup_provider=F, aio=True)
+            eq(s, await g(state={'y': 0, 'f': 0}), True)
+
+        asyncio.run(main())
+
+    def test_qualify(s):
+        import asyncio
+
+        F = s.providers([])
+        conds = {'x': ':fast eq 1', 'y': ':x and :slow eq 1', 'z': 'a eq 2'}
+        q = pc.qualify(conds, lookup_provider=F, aio=True)
+
+        async def main():
+            eq(s, await q({'s': 1, 'f': 1, 'a': 2}), {'x': True, 'y': True, 'z': True})
+            eq(s, await q({'s': 1, 'f': 0, 'a': 2}), {'x': False, 'y': False, 'z': True})
+            items = [{'s': 0, 'f': 0, 'a': 0}, {'s': 0, 'f': 0, 'a': 2}]
+            eq(s, await q.many(items, indices=True), [1])
+
+        asyncio.run(main())
+
+    def test_qualify_shared_once(s):
+        import asyncio
+
+        calls = []
+        F = s.providers(calls)
+        conds = {'x': ':fast', 'y': ':x and a', 'z': 'a and :x', 'w': ':fast and a'}
+        for kw in {}, {'root': 'y'}, {'match_any': False}:
+            del calls[:]
+            q = pc.qualify(conds, lookup_provider=F, aio=True, **kw)
+            r = asyncio.run(q({'f': 1, 'a': 1}))
+            assert r['x'] is True
+            eq(s, calls, ['fast'])  # once per item, also while in flight
+
+
+class Prefetch(T):
+    def providers(s, calls):
+        class F:
+            def geo(k, v, cfg, data, **kw):
+                calls.append('geo')
+                time.sleep(0.1)
+                return data['g'], v
+
+            def risk(k, v, cfg, data, **kw):
+                calls.append('risk')
+                time.sleep(0.1)
+                return data['r'], v
+
+        return F
+
+    def test_parallel(s):
+        calls = []
+        F = s.providers(calls)
+        f = pycond(':geo eq 1 and :risk eq 1', lookup_provider=F, prefetch=True)
+        t0, c = time.time(), {}
+        eq(s, f(state={'g': 1, 'r': 1}, pyc_cache=c), True)
+        assert time.time() - t0 < 0.18
+        eq(s, (sorted(calls), c), (['geo', 'risk'], {'geo': 1, 'risk': 1}))
+        eq(s, f(state={'g': 0, 'r': 1}), False)
+
+    def test_short_circuit_cleans_cache(s):
+        F = s.providers([])
+        f = pycond('a eq 1 and :geo eq 1', lookup_provider=F, prefetch=True)
+        c = {}
+        eq(s, f(state={'a': 0, 'g': 1}, pyc_cache=c), False)
+        eq(s, c, {})
+
+    def test_limit_and_selection(s):
+        F = s.providers([])
+        cond = ':geo eq 1 and :risk eq 1'
+        for pf in 1, ['geo']:
+            t0 = time.time()
+            eq(s, pycond(cond, lookup_provider=F, prefetch=pf)(state={'g': 1, 'r': 1}), True)
+            assert time.time() - t0 > 0.18  # only one prefetched
+
+    def test_sub_conditions_not_prefetched(s):
+        calls = []
+        F = s.providers(calls)
+        conds = {'g': ':geo eq 1', 'x': 'a eq 1 and :g'}
+        q = pc.qualify(conds, lookup_provider=F, prefetch=True, root='x')
+        eq(s, q({'a': 0, 'g': 1})['x'], False)
+        time.sleep(0.05)
+        eq(s, calls, [])  # the sub condition g was not run in the pool
+        subs = q.args[0].keywords['lookup_provider_dict']
+        assert subs['g']['func'].pyc_sub_cond
+
+
+class Parallel(T):
+    def test_qualify_parallel(s):
+        conds = {'big': 'amount gt 100', 'small': 'amount lt 10'}
+        items = [{'amount': i} for i in range(1000)]
+        q = pc.qualify(conds)
+        r = pc.qualify_parallel(conds, iter(items), workers=2, chunksize=30)
+        eq(s, list(r), [q(x) for x in items])
+        r = pc.qualify_parallel(conds, items, workers=3, chunksize=7, ordered=False, into='m')
+        r = sorted(r, key=lambda x: x['amount'])
+        eq(s, r[50], {'amount': 50, 'm': {'big': False, 'small': False}})
+        eq(s, len(r), 1000)
+
+
+class PickleProviders:
+    def hello(k, v, cfg, data, **kw):
+        return data['foo'], v
+
+
+class Pickle(T):
+    def test_pickle_cond(s):
+        import pickle
+
+        st = {'a': 1, 'b': 0, 'foo': 3}
+        for kw in {}, {'compile': True}, {'prefix': 'p'}:
+            f = pycond('a eq 1 and [b gt 2 or :hello eq 3]', lookup_provider=PickleProviders, **kw)
+            g = pickle.loads(pickle.dumps(f))
+            assert g is not f
+            st1 = {'p': st} if kw.get('prefix') else st
+            eq(s, g(state=st1), True)
+        m = pickle.loads(pickle.dumps(pc.make_filter('a eq 1')))
+        eq(s, list(filter(m, [{'a': 1}, {'a': 2}])), [{'a': 1}])
+
+    def test_pickle_qualifier(s):
+        import pickle
+
+        conds = {'x': 'a eq 1', 'y': ':x and :hello eq 3'}
+        q = pc.qualify(conds, lookup_provider=PickleProviders, cse=True)
+        q2 = pickle.loads(pickle.dumps(q))
+        eq(s, q2({'a': 1, 'foo': 3}), {'x': True, 'y': True})
+        eq(s, q2.many([{'a': 2}]), [{'x': False, 'y': False}])
+        # pickled are the structures, unpickling does not tokenize again:
+        q.replace('x', 'a eq 2')
+        eq(s, q.pyc_src[1][0], {'x': ['a', 'eq', '2'], 'y': [':x', 'and', ':hello', 'eq', '3']})
+        tokenize, pc.tokenize = pc.tokenize, None
+        try:
+            q2 = pickle.loads(pickle.dumps(q))
+        finally:
+            pc.tokenize = tokenize
+        eq(s, q2({'a': 2, 'foo': 3}), {'x': True, 'y': True})
+
+
+class Bundle(T):
+    def test_save_load(s):
+        import tempfile, marshal
+
+        conds = {'r%s' % i: 'a eq %s and [b gt 2 or :hello eq 3]' % i for i in range(5)}
+        cfg = dict(lookup_provider=PickleProviders, compile=True)
+        x = {'a': 3, 'b': 0, 'foo': 3}
+        with tempfile.TemporaryDirectory() as d:
+            fn = d + '/rules.bundle'
+            q = pc.save_bundle(fn, conds, **cfg)
+            b = marshal.loads(open(fn, 'rb').read())
+            eq(s, len(b['structs']), 5)
+            eq(s, len(b['codes']), 1)  # same code for all, values are in the namespace
+            n = []
+            pc.compile = lambda *a: n.append(1) or compile(*a)
+            try:
+                q2 = pc.load_bundle(fn, **cfg)
+                eq(s, n, [])  # nothing tokenized or compiled
+                eq(s, q2(x), q(x))
+                eq(s, q2(x)['r3'], True)
+                # invalidation:
+                pc.OPS['eq'] = lambda a, b: a == b
+                q2 = pc.load_bundle(fn, **cfg)
+                eq(s, len(n), 1)  # built from scratch, then the same code for all
+                eq(s, q2(x), q(x))
+                b2 = marshal.loads(open(fn, 'rb').read())
+                assert b2['fingerprint'] != b['fingerprint']  # saved again
+            finally:
+                del pc.compile
+                pc.ops_reset()
+            # compile backend by default:
+            pc.save_bundle(fn, conds, lookup_provider=PickleProviders)
+            eq(s, len(marshal.loads(open(fn, 'rb').read())['codes']), 1)
+            eq(s, pc.load_bundle(fn, lookup_provider=PickleProviders)(x), q(x))
+
+    def test_fingerprint_stable(s):
+        import subprocess
+
+        prog = '\n'.join(
+            [
+                'import pycond as pc',
+                'class P:',
+                '    def p(k, v, cfg, data, **kw):',
+                '        l = [x for x in data if x in {"a", "b"}]',
+                '        return (lambda: len(l))(), v',
+                'print(pc.bundle_fingerprint({"lookup_provider": P}))',
+            ]
+        )
+        d = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        res = set()
+        for seed in '1', '2', '3':
+            env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=d)
+            res.add(subprocess.check_output([sys.executable, '-c', prog], env=env))
+        eq(s, len(res), 1)
+
+
+class Stream(T):
+    def test_qualify_stream(s):
+        import json, tempfile
+
+        lines = [json.dumps({'name': 'r%s' % i, 'cond': 'a eq %s' % i}) for i in range(50)]
+        lines[5] = '{bad json'
+        lines[6] = json.dumps(['x', ':later and a eq 6'])  # refers to a later one
+        lines[7] = json.dumps({'y': 'a eq [ 1'})
+        lines += [json.dumps({'later': 'b gt 1'}), '', json.dumps({'r1': 'a eq 1'})]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as fd:
+            fd.write('\n'.join(lines))
+            fd.flush()
+            for src, workers in (lines, None), (fd.name, None), (iter(lines), 2):
+                q = pc.qualify_stream(src, workers=workers, chunksize=7)
+                errs = [(e[0], type(e[1]).__name__) for e in q.errors]
+                eq(s, errs, [(6, 'JSONDecodeError'), ('y', 'ParseError'), ('r1', 'Exception')])
+                r = q({'a': 6, 'b': 2})
+                eq(s, len(r), 49)
+                eq(s, [k for k, v in r.items() if v], ['later', 'x'])
+
+
+class Update(T):
+    def test_add_replace_remove(s):
+        import pickle
+
+        conds = {'a': 'x eq 1', 'b': ':a and y eq 2', 'c': 'type eq o'}
+        for kw in {}, {'index': True}:
+            q = pc.qualify(dict(conds), **kw)
+            eq(s, q({'x': 1, 'y': 2})['b'], True)
+            q.add('d', 'type eq p and x eq 1')
+            eq(s, q({'x': 1, 'type': 'p'})['d'], True)
+            q.replace('a', 'x eq 5')
+            r = q({'x': 5, 'y': 2})
+            eq(s, (r['a'], r['b']), (True, True))  # b refers to the new a
+            s.assertRaises(ValueError, q.remove, 'a')  # b refers to it
+            s.assertRaises(KeyError, q.add, 'c', 'x eq 1')
+            s.assertRaises(KeyError, q.replace, 'e', 'x eq 1')
+            q.remove('b')
+            q.remove('a')
+            r = q({'x': 1, 'type': 'p'})
+            eq(s, r['d'], True)
+            assert 'a' not in r
+            eq(s, q.many([{'type': 'o'}])[0]['c'], True)
+            q2 = pickle.loads(pickle.dumps(q))
+            eq(s, q2({'x': 1, 'type': 'p'}), r)
+
+    def test_old_version_unchanged(s):
+        q = pc.qualify({'a': 'x eq 1', 'b': ':a and y eq 2', 'c': 'y eq 2'})
+        old = q.args[0]
+        q.replace('a', 'x eq 5')
+        q.remove('b')
+        # in flight evaluations of the old version:
+        eq(s, old({'x': 1, 'y': 2}, pyc_cache={}), {'a': True, 'b': True, 'c': True})
+        eq(s, q({'x': 5, 'y': 2}), {'a': True, 'c': True})
+
+
+class SpecVal(T):
+    def test_in_set(s):
+        vals = list(range(1000))
+        for kw in {}, {'compile': True}, {'cse': True}:
+            f, nfo = pc.parse_cond(['a', 'in', vals], **kw)
+            eq(s, [f(state={'a': v}) for v in (999, -1, [1], None)], [True, False, False, False])
+            f = pc.pycond(['a', 'not', 'in', vals], **kw)
+            eq(s, f(state={'a': 999}), False)
+        eq(s, type(nfo['tree']['f_op'].args[0]), frozenset)
+        # lookups get the values as given:
+        got = []
+        look = lambda k, v, state, **kw: got.append(v) or (state.get(k), v)
+        eq(s, pc.pycond(['a', 'in', [1, 2]], lookup=look)(state={'a': 2}), True)
+        eq(s, got, [[1, 2]])
+        # unhashable values: kept as list:
+        eq(s, pc.pycond(['a', 'in', [[1], 2]])(state={'a': [1]}), True)
+        q = pc.qualify({'x': ['a', 'in', [1, 2]], 'y': 'a eq 3'}, index=True)
+        eq(s, q({'a': 2}), {'x': True, 'y': False})
+
+    def test_matches(s):
+        f = pc.pycond('a matches "^ab+c$"')
+        eq(s, [f(state={'a': v}) for v in ('abbc', 'ac', None, 1)], [True, False, False, False])
+        f, nfo = pc.parse_cond(['a', 'not', 'matches', '(?i)X'], compile=True)
+        eq(s, (f(state={'a': 'yx'}), f(state={'a': 'y'})), (False, True))
+        eq(s, nfo['tree']['f_op'].args[0].pattern, '(?i)X')
+        # no autoconv for patterns:
+        for q in {}, {'multi_regex': True}:
+            r = pc.qualify({'a': 'a matches 1', 'b': 'a matches true'}, **q)
+            eq(s, r({'a': 'x1 true'}), {'a': True, 'b': True})
+            eq(s, r({'a': 2}), {'a': False, 'b': False})
+        s.assertRaises(re.error, pc.pycond, 'a matches "[x"')
+
+    def test_iso_time(s):
+        f = pc.pycond('t gt 2024-01-01T00:00:00Z and t lt 2024-01-02', iso_time=True)
+        eq(s, (f(state={'t': 1704067200.5}), f(state={'t': 1704067200})), (True, False))
+        f = pc.pycond('t gt 2024-01-01T01:00:00+01:00', iso_time=True)
+        eq(s, f(state={'t': 1704067200.5}), True)
+        # opt in:
+        eq(s, pc.pycond('t eq 2024-01-01')(state={'t': '2024-01-01'}), True)
+
+
+class MultiRegex(T):
+    def test_shared_scans(s):
+        conds = {
+            'a': 'url matches "^/api/"',
+            'b': 'url matches admin and k eq 1',
+            'c': 'url not matches admin',
+            'd': 'url matches "(?i)ADMIN"',
+            'e': 'url matches "x\\.php$"',
+        }
+        items = ['/api/admin', '/Admin/x.php', None, 1]
+        for mr in True, False:
+            q = pc.qualify(conds, multi_regex=mr)
+            r = [[k for k, v in q({'url': u, 'k': 1}).items() if v] for u in items]
+            eq(s, r, [['a', 'b', 'd'], ['c', 'd', 'e'], ['c'], ['c']])
+        cache = {}
+        pc.qualify(conds)({'url': '/admin', 'k': 1}, pyc_cache=cache)
+        # admin searched once, for b and c:
+        eq(s, sorted(cache[('pyc_re', 'url')][1]), [0, 1, 2, 3])
+
+
+class Graph(T):
+    def test_dependency_order(s):
+        called = []
+
+        def exp(k, v, cfg, data, **kw):
+            called.append(k)
+            return data['a'], v
+
+        conds = {'b': 'c eq 1 and :a', 'a': ':exp gt 1', 'x': ':b or :a', 'y': 'c eq 1'}
+        q = pc.qualify(conds, lookup_provider_dict={'exp': {'func': exp}})
+        r = q({'a': 2, 'c': 1})
+        eq(s, list(r), ['b', 'a', 'x', 'y'])  # given order
+        eq(s, r, {'b': True, 'a': True, 'x': True, 'y': True})
+        eq(s, called, ['exp'])
+        # only what the roots need:
+        called.clear()
+        q = pc.qualify(conds, root=['y', 'b'], lookup_provider_dict={'exp': {'func': exp}})
+        r = q({'a': 2, 'c': 0})
+        eq(s, (r['y'], r['b']), (False, False))
+        assert 'x' not in r
+        eq(s, called, [])
+        s.assertRaises(KeyError, pc.qualify, {'a': 'x'}, root='z')
+
+    def test_cycles(s):
+        for conds in {'a': ':b', 'b': ':a'}, {'a': 'x and :a'}, {'a': ':b', 'b': ':c', 'c': ':a or x'}:
+            s.assertRaises(ValueError, pc.qualify, conds)
+        q = pc.qualify({'a': 'x eq 1', 'b': ':a'})
+        s.assertRaises(ValueError, q.replace, 'a', ':b')
+        eq(s, q({'x': 1}), {'a': True, 'b': True})
+
+
+class Incremental(T):
+    def test_dirty_keys(s):
+        conds = {'r%s' % i: 'a eq %s and c eq 1' % i for i in range(10)}
+        conds['deep'] = 'd.e eq 1'
+        conds['sub'] = ':r3 and x eq 1'  # sub conditions are always evaluated
+        q = pc.qualify(conds, incremental=True, deep='.')
+        st = {'a': 3, 'c': 0, 'd': {'e': 1}, 'x': 1}
+        i = pc.IncrementalState(q, st)
+        eq(s, i.results, q(st))
+        st['c'] = 1
+        eq(s, i.update(['c']), {'r3': True, 'sub': True})
+        st['d'] = {'e': 0}
+        eq(s, i.update(['d.e']), {'deep': False})
+        st['a'] = 4
+        eq(s, i.update(['a']), {'r3': False, 'r4': True, 'sub': False})
+        eq(s, i.results, q(st))
+        eq(s, i.update(['x']), {})
+        s.assertRaises(ValueError, pc.IncrementalState, pc.qualify(conds), st)
+        # nothing would be memoized with these:
+        for kw in {'compile': True}, {'cse': True}, {'aio': True}:
+            s.assertRaises(ValueError, pc.qualify, conds, incremental=True, **kw)
+
 
 if __name__ == '__main__':
     # tests/test_pycond.py PyCon.test_auto_brackets
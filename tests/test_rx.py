@@ -70,6 +70,145 @@ class Tests:
         assert 'Dummy' in t[0]
         assert l == [{'mod': {'b2': True, 'b1': True, 'root': True}, 'payload': {'a': 1}}]
 
+    def test_rx_batch(self):
+        """batched, bulk and flattened"""
+
+        def run(cond, **kw):
+            l = []
+            s = Rx.from_(range(10)).pipe(rx.map(lambda i: {'i': i}), pc.rxop(cond, **kw))
+            s.subscribe(l.append)
+            return l
+
+        l = run(['i', 'lt', 7], batch=4, batch_time=1)
+        assert [[m['i'] for m in b] for b in l] == [[0, 1, 2, 3], [4, 5, 6]]
+        l = run({'a': ['i', 'lt', 7]}, into='mod', batch=4, flatten=True)
+        assert [m['mod']['a'] for m in l] == [True] * 7 + [False] * 3
+
+        # errors and async items handled per item:
+        class P:
+            def bad(k, v, cfg, data, **kw):
+                if data['i'] == 3:
+                    raise ValueError(3)
+                return True, v
+
+            def slow(k, v, cfg, data, **kw):
+                time.sleep(0.01)
+                return data['i'] > 5, v
+
+        errs = []
+        eh = lambda x, exc, **kw: errs.append((x['i'], exc.args))
+        l = run('i ge 0 and :bad', lookup_provider=P, batch=4, flatten=True, err_handler=eh)
+        assert [m['i'] for m in l] == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+        assert errs == [(3, (3,))]
+        l = run('i ge 0 and :slow', lookup_provider=P, asyn=['slow'], batch=4, flatten=True)
+        t0 = time.time()
+        while len(l) < 4 and time.time() - t0 < 5:
+            time.sleep(0.01)
+        assert sorted([m['i'] for m in l]) == [6, 7, 8, 9]
+
+    def test_rx_async_lanes(self):
+        """bounded lanes, with gauges"""
+
+        class P:
+            max_in_flight = 0
+
+            def slow(k, v, cfg, data, **kw):
+                P.max_in_flight = max(P.max_in_flight, op.lane.stats()['in_flight'])
+                time.sleep(0.02)
+                return True, v
+
+        def fail(i):
+            raise ValueError(i)
+
+        for lane in 'gevent', 'threads', 'asyncio':
+            P.max_in_flight = 0
+            op = pc.rxop(
+                ['a', 'and', ':slow'], lookup_provider=P, asyn=['slow'], lane=lane, lane_limit=2
+            )
+            l = []
+            Rx.from_(range(6)).pipe(rx.map(lambda i: {'a': 1, 'i': i}), op).subscribe(l.append)
+            t0 = time.time()
+            while len(l) < 6 and time.time() - t0 < 5:
+                time.sleep(0.01)
+            time.sleep(0.01)
+            st = op.lane.stats()
+            assert (st['in_flight'], st['queued'], st['done']) == (0, 0, 6)
+            assert P.max_in_flight == 2
+
+            # errors of the spawned functions are surfaced, not lost:
+            errs = []
+            op.lane.err_handler = errs.append
+            for i in range(3):
+                op.lane.spawn(fail, i)
+            t0 = time.time()
+            while op.lane.stats()['done'] < 9 and time.time() - t0 < 5:
+                time.sleep(0.01)
+            assert sorted([e.args[0] for e in errs]) == [0, 1, 2]
+            assert op.lane.stats()['errors'] == 3
+
+    def test_rx_async_ordered(self):
+        """input order kept, with timeout policy"""
+
+        class P:
+            def slow(k, v, cfg, data, **kw):
+                time.sleep(data['t'])
+                return True, v
+
+        def run(ts, lane='threads', **kw):
+            l, errs, done = [], [], []
+            op = pc.rxop(
+                ['a', 'and', ':slow'],
+                lookup_provider=P,
+                asyn=['slow'],
+                lane=lane,
+                ordered=True,
+                err_handler=lambda x, exc, **kw: errs.append((x['i'], type(exc))),
+                **kw
+            )
+            items = [{'a': t is not None, 't': t, 'i': i} for i, t in enumerate(ts)]
+            s = Rx.from_(items).pipe(op)
+            s.subscribe(lambda x: l.append(x['i']), on_completed=lambda: done.append(1))
+            t0 = time.time()
+            while not done and time.time() - t0 < 5:
+                time.sleep(0.01)
+            return l, errs
+
+        # the sync ones (a False) are filtered, 1 and 2 wait for 0:
+        l, errs = run([0.05, 0.01, 0, None, 0.02])
+        assert l == [0, 1, 2, 4] and not errs
+        l, errs = run([0.3, 0.01, None, 0], reorder_timeout=0.1, reorder_max=2)
+        assert l == [1, 3]
+        assert errs == [(0, TimeoutError)]
+        # the default (gevent) lane, full buffer:
+        l, errs = run([0.02, 0.01, 0, 0.01, 0], lane='gevent', reorder_max=2)
+        assert l == [0, 1, 2, 3, 4] and not errs
+
+    def test_rx_async_ordered_gevent_unpatched(self):
+        """a full reorder buffer must not block the hub, w/o monkey patching as well"""
+        import os, subprocess
+
+        prog = '\n'.join(
+            [
+                'import gevent, pycond as pc',
+                'Rx, rx = pc.import_rx()',
+                'class P:',
+                '    def slow(k, v, cfg, data, **kw):',
+                '        gevent.sleep(0.01)',
+                '        return True, v',
+                'op = pc.rxop(["a", "and", ":slow"], lookup_provider=P, asyn=["slow"],',
+                '             ordered=True, reorder_max=2)',
+                'l = []',
+                'Rx.from_(range(5)).pipe(rx.map(lambda i: {"a": 1, "i": i}), op).subscribe(l.append)',
+                'while len(l) < 5:',
+                '    gevent.sleep(0.01)',
+                'print([x["i"] for x in l])',
+            ]
+        )
+        d = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=d)
+        out = subprocess.check_output([sys.executable, '-c', prog], env=env, timeout=20)
+        assert out.strip() == b'[0, 1, 2, 3, 4]'
+
 
 if __name__ == '__main__':
     Tests().test_rx_async1_prefix()
@@ -120,7 +120,7 @@ class Tests:
             )
             s.subscribe(add, on_completed=unblock)
             ev.wait()
-            if not kw:
+            if not kw.get('asyn'):
                 # same thread
                 assert l[-1]['odd'] == l[-1]['blocking']
                 assert l[0]['i'] == 0  # 0 was sleeping a bit but we are sync
@@ -143,10 +143,20 @@ class Tests:
             res = _rxrun(asyn=['blocking'])
             return res
 
+        def rxbatch():
+            return _rxrun(batch=500, flatten=True)
+
         _measure(direct)
         _measure(qual)
         _measure(rxsync)
         _measure(rxasync)
+        _measure(rxbatch)
+        # best of 3, the single runs are noisy:
+        for f in rxsync, rxasync, rxbatch:
+            for i in range(2):
+                dt = res[f.__name__]
+                _measure(f)
+                res[f.__name__] = min(dt, res[f.__name__])
         # to see that mem goes down after the greenlets are done:
         # while True:
         #     time.sleep(5)
@@ -159,6 +169,8 @@ class Tests:
         # yes, we are 10 times slower when all items are processed async:
         # doing this with rx.group_by(needs_asnc) -> flat_map(s.pipe(map(rx.just(x, GS)))) was far far slower yet, so I'm sort of ok with our 10k / sec:
         assert res['rxasync'] < 15 * res['direct']
+        # one qualifier.many call per batch, compiled conditions:
+        assert res['rxbatch'] < 0.8 * res['rxsync']
 
 
 if __name__ == '__main__':